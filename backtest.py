@@ -0,0 +1,109 @@
+### Libraries
+import os
+import itertools
+import numpy as np
+import pandas as pd
+from sklearn.metrics import mean_squared_error
+from math import sqrt
+from concurrent.futures import ProcessPoolExecutor
+from datalake import get_data_lake
+from cleaning import load_cleaned_frames
+from utils import load_json, save_json
+from forecasting import fit_arima, init_worker, serial_fitting, series_hash, forecast_workers, order_selection_path
+
+### Backtesting Setup
+# Every (p, d, q) in the grid is evaluated with rolling-origin folds: fit on the
+# first t years, forecast year t + 1, for every t from min_train_size onwards
+order_grid = list(itertools.product((0, 1, 2), (0, 1), (0, 1, 2)))
+default_order = (1, 1, 1)
+min_train_size = int(os.environ.get("BACKTEST_MIN_TRAIN", 5))
+
+# One-step predictions per fold, keyed by the hash of the training window and order,
+# so a new year only costs the folds that did not exist before
+fold_cache_path = ".cache/backtest-folds.json"
+rmse_table_path = "data/BacktestRMSE.csv"
+
+def load_fold_cache():
+    return load_json(fold_cache_path, {})
+
+def save_fold_cache(fold_cache):
+    save_json(fold_cache, fold_cache_path)
+
+def rolling_origin_folds(values):
+    return [(values[:t], values[t]) for t in range(min_train_size, len(values))]
+
+### Parallel Fold Evaluation
+def fit_folds(task):
+    # One task covers every missing fold of one (metric, state, order)
+    name, state, order, folds = task
+    return [(fold_hash, fit_arima(state, train, name, order, verbose=False)[0]) for fold_hash, train in folds]
+
+def run_backtest(stats_frames, workers=None, grid=None):
+    workers = forecast_workers if workers is None else workers
+    grid = grid or order_grid
+    fold_cache = load_fold_cache()
+
+    evaluations = []
+    tasks = []
+    for name, stats in stats_frames.items():
+        count_column = f"{name}Count"
+        for state, state_data in stats.sort_values(['State', 'Year']).groupby('State', sort=False):
+            folds = rolling_origin_folds(state_data[count_column].to_numpy(dtype=float))
+            for order in grid:
+                hashed_folds = [(series_hash(train, order), train, actual) for train, actual in folds]
+                evaluations.append((name, state, order, hashed_folds))
+                missing = [(fold_hash, train) for fold_hash, train, _ in hashed_folds if fold_hash not in fold_cache]
+                if missing:
+                    tasks.append((name, state, order, missing))
+
+    print(f"Backtesting {len(evaluations)} state/order combinations, {sum(len(task[3]) for task in tasks)} folds to fit")
+    if workers <= 1 or len(tasks) <= 1:
+        with serial_fitting():
+            results = [fit_folds(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            results = list(executor.map(fit_folds, tasks, chunksize=max(1, len(tasks) // (workers * 8))))
+    for fold_results in results:
+        for fold_hash, prediction in fold_results:
+            fold_cache[fold_hash] = None if np.isnan(prediction) else float(prediction)
+    save_fold_cache(fold_cache)
+
+    rows = []
+    for name, state, order, hashed_folds in evaluations:
+        predictions = [fold_cache[fold_hash] for fold_hash, _, _ in hashed_folds]
+        actuals = [actual for _, _, actual in hashed_folds]
+        # An order that fails on any fold is not eligible
+        if not predictions or any(prediction is None for prediction in predictions):
+            rmse = np.nan
+        else:
+            rmse = sqrt(mean_squared_error(actuals, predictions))
+        rows.append({'Metric': name,
+                     'State': state,
+                     'Order': ','.join(map(str, order)),
+                     'RMSE': rmse,
+                     'Folds': len(hashed_folds)})
+    return pd.DataFrame(rows)
+
+def select_orders(rmse_table):
+    # Lowest RMSE per metric and state; states without any usable order keep the default
+    selection = []
+    for (name, state), group in rmse_table.groupby(['Metric', 'State'], sort=True):
+        usable = group.dropna(subset=['RMSE'])
+        if usable.empty:
+            order, rmse = ','.join(map(str, default_order)), np.nan
+        else:
+            best = usable.loc[usable['RMSE'].idxmin()]
+            order, rmse = best['Order'], best['RMSE']
+        selection.append({'Metric': name, 'State': state, 'Order': order, 'RMSE': rmse})
+    return pd.DataFrame(selection)
+
+
+if __name__ == "__main__":
+    frames = load_cleaned_frames(get_data_lake())
+    rmse_table = run_backtest({"Mortality": frames["mortality_number_stats"],
+                               "Hospitalization": frames["hospitalization_number_stats"]})
+    rmse_table.to_csv(rmse_table_path, index=False)
+
+    selection = select_orders(rmse_table)
+    selection.to_csv(order_selection_path, index=False)
+    print(selection.groupby(['Metric', 'Order']).size().rename('States').reset_index().to_string(index=False))
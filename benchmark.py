@@ -0,0 +1,477 @@
+### Libraries
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import threading
+import subprocess
+import importlib.util
+import numpy as np
+import pandas as pd
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from utils import save_json, max_rss_mb
+
+### Benchmark Setup
+# Every stage runs in its own process, so its peak RSS is its own, against inputs
+# generated once per scale factor under benchmark_dir. The database stages use the
+# PostgreSQL database given by PGHOST/PGDATABASE/PGUSER/PGPASSWORD (and PGPORT)
+benchmark_dir = os.environ.get("BENCHMARK_DIR", ".cache/benchmark")
+results_path = os.environ.get("BENCHMARK_RESULTS", "benchmark-results.json")
+baseline_path = os.environ.get("BENCHMARK_BASELINE", "benchmark-baseline.json")
+
+# reload, refresh and api run against what the load stage loaded at the same scale factor
+stages = ["cleaning", "forecasting", "load", "reload", "refresh", "api"]
+default_scale_factors = [1, 10]
+
+# A metric that is worse than the baseline by more than this share is a regression
+default_tolerance = 0.10
+
+# Input sizes at SF=1; everything scales linearly
+cdi_rows_per_sf = 100000
+forecast_states_per_sf = 52
+forecast_years = range(2010, 2022)
+
+# API load: requests for random customers, sent by this many concurrent clients
+default_api_requests = 2000
+default_api_concurrency = 16
+server_start_timeout = 30
+
+backend_dir = os.path.join("user-interface", "frontend", "backend")
+
+def load_script(path, name):
+    # Loads one of the hyphenated scripts as a module; their __main__ blocks do not run
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def sf_dir(sf):
+    return os.path.join(benchmark_dir, f"sf{sf:g}")
+
+def tables_dir(sf):
+    return os.path.join(sf_dir(sf), "tables")
+
+def format_number(value, spec):
+    # Stages that processed nothing in no time report None
+    return "-" if value is None else format(value, spec)
+
+def percentiles(latencies):
+    if not latencies:
+        return None
+    values = np.asarray(latencies, dtype=float) * 1000
+    return {"p50": float(np.percentile(values, 50)),
+            "p95": float(np.percentile(values, 95)),
+            "p99": float(np.percentile(values, 99)),
+            "max": float(values.max())}
+
+### Inputs
+cdi_topics = {
+    "Cardiovascular Disease": ["Mortality from heart failure",
+                               "Mortality from coronary heart disease",
+                               "Hospitalization for heart failure among Medicare-eligible persons aged >= 65 years"],
+    "Diabetes": ["Mortality due to diabetes reported as any listed cause of death",
+                 "Hospitalization with diabetes as a listed diagnosis"],
+    "Chronic Obstructive Pulmonary Disease": [
+        "Mortality with chronic obstructive pulmonary disease as underlying cause among adults aged >= 45 years",
+        "Hospitalization for chronic obstructive pulmonary disease as first-listed diagnosis"],
+    "Older Adults": ["Hospitalization for hip fracture among Medicare-eligible persons aged >= 65 years"],
+    "Alcohol": ["Binge drinking prevalence among adults aged >= 18 years"],
+}
+cdi_value_types = ["Number", "Crude Rate", "Age-adjusted Rate", "Crude Prevalence"]
+cdi_stratifications = [("Overall", "Overall"), ("Gender", "Male"), ("Gender", "Female"),
+                       ("Race/Ethnicity", "Hispanic"), ("Race/Ethnicity", "White, non-Hispanic")]
+
+def prepare_cdi_lake(sf):
+    # A local data lake with CDI-shaped rows, partitioned like the real one
+    from datalake import LocalDataLake, write_partitioned_dataset, upload_dataset
+
+    lake_dir = os.path.join(sf_dir(sf), "data-lake")
+    if os.path.exists(lake_dir):
+        return lake_dir
+    rows = int(cdi_rows_per_sf * sf)
+    rng = np.random.default_rng(0)
+    states = load_script("create-data.py", "create_data").synthetic_states + ["United States"]
+    questions = [(topic, question) for topic, topic_questions in cdi_topics.items() for question in topic_questions]
+    question_index = rng.integers(0, len(questions), rows)
+    stratification_index = rng.integers(0, len(cdi_stratifications), rows)
+    years = rng.integers(2001, 2022, rows)
+    values = np.round(rng.lognormal(6, 1.5, rows), 1).astype(str)
+    values[rng.random(rows) < 0.05] = ""
+
+    frame = pd.DataFrame({"yearstart": years,
+                          "yearend": years,
+                          "locationdesc": np.array(states, dtype=object)[rng.integers(0, len(states), rows)],
+                          "topic": [questions[index][0] for index in question_index],
+                          "question": [questions[index][1] for index in question_index],
+                          "datavaluetype": np.array(cdi_value_types, dtype=object)[rng.integers(0, len(cdi_value_types), rows)],
+                          "stratificationcategory1": [cdi_stratifications[index][0] for index in stratification_index],
+                          "stratification1": [cdi_stratifications[index][1] for index in stratification_index],
+                          "datavalue": values})
+    os.makedirs(sf_dir(sf), exist_ok=True)
+    csv_path = os.path.join(sf_dir(sf), "cdi.csv")
+    parquet_dir = os.path.join(sf_dir(sf), "cdi-parquet")
+    frame.to_csv(csv_path, index=False)
+    write_partitioned_dataset(csv_path, parquet_dir)
+    upload_dataset(LocalDataLake(lake_dir + ".tmp"), parquet_dir)
+    os.replace(lake_dir + ".tmp", lake_dir)
+    return lake_dir
+
+def prepare_tables(sf):
+    # All 17 CSVs from `create-data.py --sf`; InvoiceDetail.csv is written last
+    if not os.path.exists(os.path.join(tables_dir(sf), "InvoiceDetail.csv")):
+        subprocess.run([sys.executable, "create-data.py", "--sf", f"{sf:g}", "--output-dir", tables_dir(sf)],
+                       check=True)
+    return tables_dir(sf)
+
+def forecast_stats(sf, name):
+    # Random-walk yearly counts for forecast_states_per_sf * sf synthetic states
+    rng = np.random.default_rng(1)
+    states = [f"State {index:05d}" for index in range(int(forecast_states_per_sf * sf))]
+    steps = rng.normal(0, 500, (len(states), len(forecast_years)))
+    counts = np.maximum(np.cumsum(steps, axis=1) + rng.uniform(5000, 50000, (len(states), 1)), 0).astype(np.int64)
+    return pd.DataFrame({"Year": np.tile(list(forecast_years), len(states)),
+                         "State": np.repeat(states, len(forecast_years)),
+                         f"{name}Count": counts.ravel()})
+
+### Database
+def connect():
+    import psycopg2
+    return psycopg2.connect(**load_script("reload-forecasts.py", "reload_forecasts").db_params)
+
+def database_url():
+    if os.environ.get("DATABASE_URL"):
+        return os.environ["DATABASE_URL"]
+    params = load_script("reload-forecasts.py", "reload_forecasts").db_params
+    port = f":{os.environ['PGPORT']}" if os.environ.get("PGPORT") else ""
+    return (f"postgresql://{quote(params['user'], safe='')}:{quote(params['password'], safe='')}"
+            f"@{params['host']}{port}/{params['database']}")
+
+def reset_schema(conn):
+    with conn.cursor() as cur:
+        for path in ["drop-tables.sql", "create-tables.sql", "create-materialized-views.sql"]:
+            with open(path) as f:
+                cur.execute(f.read())
+    conn.commit()
+
+def csv_row_count(path):
+    with open(path, "rb") as f:
+        return sum(1 for _ in f) - 1
+
+def unique_row_count(path, pk_columns):
+    from dedup import deduplicated_rows
+
+    _, rows = deduplicated_rows(path, pk_columns)
+    return sum(1 for _ in rows)
+
+### Stages
+# Each returns what it processed; "seconds" covers only the measured work, not the
+# imports and input preparation around it
+def run_cleaning(sf, options):
+    from datalake import LocalDataLake
+    from cleaning import load_cdi_data, clean_cdi_data
+
+    lake = LocalDataLake(prepare_cdi_lake(sf))
+    started = time.perf_counter()
+    frames = clean_cdi_data(load_cdi_data(lake))
+    seconds = time.perf_counter() - started
+    return {"units": "rows", "count": int(cdi_rows_per_sf * sf), "seconds": seconds,
+            "output_rows": sum(len(frame) for frame in frames.values())}
+
+def run_forecasting(sf, options):
+    from forecasting import process_dataframe
+
+    frames = {name: forecast_stats(sf, name) for name in ["Mortality", "Hospitalization"]}
+    started = time.perf_counter()
+    latencies = []
+    for name, stats in frames.items():
+        metric_started = time.perf_counter()
+        # No model store, so every series is fitted
+        process_dataframe(stats, name, model_store=None)
+        latencies.append(time.perf_counter() - metric_started)
+    seconds = time.perf_counter() - started
+    return {"units": "series", "count": sum(stats["State"].nunique() for stats in frames.values()),
+            "seconds": seconds, "latencies": latencies}
+
+def run_load(sf, options):
+    data_dir = prepare_tables(sf)
+    # fill-tables.py reads DATA_DIR when it is loaded
+    os.environ["DATA_DIR"] = data_dir
+    fill_tables = load_script("fill-tables.py", "fill_tables")
+
+    conn = connect()
+    try:
+        reset_schema(conn)
+        started = time.perf_counter()
+        fill_tables.load_tables(mode="full")
+        seconds = time.perf_counter() - started
+
+        # Every unique key must have arrived; duplicate keys in a CSV are dropped by the
+        # loader, so they are counted the same way, after the timed part
+        expected = loaded = 0
+        with conn.cursor() as cur:
+            for file_info in fill_tables.csv_files:
+                cur.execute(f"SELECT count(*) FROM {file_info['table_name']}")
+                loaded += cur.fetchone()[0]
+                expected += unique_row_count(file_info["file_path"], file_info["primary_key_columns"])
+    finally:
+        conn.close()
+    if loaded != expected:
+        raise RuntimeError(f"Loaded {loaded} rows, expected {expected}")
+    return {"units": "rows", "count": loaded, "seconds": seconds}
+
+def run_reload(sf, options):
+    pipeline = load_script("reload-forecasts.py", "reload_forecasts")
+    path = os.path.join(tables_dir(sf), "ChronicDiseaseForecast.csv")
+    conn = connect()
+    latencies = []
+    try:
+        for _ in range(options["repeat"]):
+            started = time.perf_counter()
+            pipeline.reload_forecasts(conn, path)
+            latencies.append(time.perf_counter() - started)
+    finally:
+        conn.close()
+    return {"units": "rows", "count": csv_row_count(path) * len(latencies), "seconds": sum(latencies),
+            "latencies": latencies}
+
+def run_refresh(sf, options):
+    pipeline = load_script("reload-forecasts.py", "reload_forecasts")
+    conn = connect()
+    latencies = []
+    try:
+        for _ in range(options["repeat"]):
+            latencies.append(sum(pipeline.refresh_materialized_views(conn).values()))
+    finally:
+        conn.close()
+    return {"units": "refreshes", "count": len(latencies), "seconds": sum(latencies), "latencies": latencies}
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for_server(url, server):
+    import requests
+
+    deadline = time.monotonic() + server_start_timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"API server exited with status {server.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise RuntimeError(f"API server did not start within {server_start_timeout}s")
+
+def run_api(sf, options):
+    import requests
+
+    customers = pd.read_csv(os.path.join(tables_dir(sf), "Customer.csv"), usecols=["CustomerSSN"])["CustomerSSN"]
+    ssns = np.random.default_rng(2).choice(customers.to_numpy(), options["requests"])
+
+    # The server gets its own process (without the reloader), so its RSS is measured apart from the clients
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen([sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(port),
+                               "--no-reload", "--no-debugger", "--with-threads"],
+                              cwd=backend_dir, env={**os.environ, "DATABASE_URL": database_url()},
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_server(base_url, server)
+        sessions = threading.local()
+
+        def get_customer(ssn):
+            if not hasattr(sessions, "session"):
+                sessions.session = requests.Session()
+            started = time.perf_counter()
+            response = sessions.session.get(f"{base_url}/api/customerssn/{ssn}")
+            response.content
+            return time.perf_counter() - started, response.status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            responses = list(executor.map(get_customer, ssns))
+        seconds = time.perf_counter() - started
+    finally:
+        # Reaped with wait4 for its rusage, unless it already exited on its own
+        rusage = None
+        if server.poll() is None:
+            server.terminate()
+            _, _, rusage = os.wait4(server.pid, 0)
+            server.returncode = 0
+
+    errors = sum(1 for _, status in responses if status != 200)
+    return {"units": "requests", "count": len(responses), "seconds": seconds,
+            "latencies": [latency for latency, _ in responses],
+            "errors": errors,
+            "concurrency": options["concurrency"],
+            "server_peak_rss_mb": max_rss_mb(rusage) if rusage else None}
+
+# Generated in the parent, so that neither their time nor their memory counts towards the stage
+stage_inputs = {"cleaning": prepare_cdi_lake,
+                "load": prepare_tables,
+                "reload": prepare_tables,
+                "api": prepare_tables}
+
+stage_functions = {"cleaning": run_cleaning,
+                   "forecasting": run_forecasting,
+                   "load": run_load,
+                   "reload": run_reload,
+                   "refresh": run_refresh,
+                   "api": run_api}
+
+### Running Stages
+def run_stage_process(stage, sf, options):
+    # Runs one stage in a child process and adds its wall time and peak RSS to what it reports
+    os.makedirs(benchmark_dir, exist_ok=True)
+    result_file = os.path.join(benchmark_dir, f"{stage}-sf{sf:g}.json")
+    if os.path.exists(result_file):
+        os.remove(result_file)
+    command = [sys.executable, os.path.abspath(__file__), "--run-stage", stage, "--sf", f"{sf:g}",
+               "--result-file", result_file, "--requests", str(options["requests"]),
+               "--concurrency", str(options["concurrency"]), "--repeat", str(options["repeat"])]
+
+    started = time.perf_counter()
+    process = subprocess.Popen(command)
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    wall_seconds = time.perf_counter() - started
+
+    result = {"stage": stage, "sf": sf, "wall_seconds": wall_seconds, "peak_rss_mb": max_rss_mb(rusage)}
+    if process.returncode != 0 or not os.path.exists(result_file):
+        result["error"] = f"exit status {process.returncode}"
+        return result
+    with open(result_file) as f:
+        measured = json.load(f)
+    latencies = measured.pop("latencies", None)
+    result.update(measured)
+    result["throughput"] = measured["count"] / measured["seconds"] if measured["seconds"] else None
+    result["latency_ms"] = percentiles(latencies)
+    if result.get("errors"):
+        result["error"] = f"{result['errors']} of {result['count']} requests failed"
+    return result
+
+def run_benchmarks(selected_stages, scale_factors, options):
+    results = []
+    for sf in scale_factors:
+        for stage in selected_stages:
+            print(f"=== {stage} at SF={sf:g}")
+            if stage in stage_inputs:
+                stage_inputs[stage](sf)
+            result = run_stage_process(stage, sf, options)
+            results.append(result)
+            if "error" in result and "throughput" not in result:
+                print(f"{stage} at SF={sf:g} failed: {result['error']}")
+            else:
+                latency = result["latency_ms"]
+                print(f"{stage} at SF={sf:g}: {format_number(result['throughput'], '.1f')} {result['units']}/s, "
+                      f"peak RSS {format_number(result['peak_rss_mb'], '.0f')} MB"
+                      + (f", p50 {latency['p50']:.1f} ms, p95 {latency['p95']:.1f} ms, p99 {latency['p99']:.1f} ms"
+                         if latency else ""))
+    return results
+
+### Results and Baseline
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def save_results(results, path):
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+              "commit": git_commit(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "cpu_count": os.cpu_count(),
+              "results": results}
+    save_json(report, path, indent=2)
+    return report
+
+# (name, getter, True when higher is better)
+compared_metrics = [("throughput", lambda result: result.get("throughput"), True),
+                    ("p95 latency", lambda result: (result.get("latency_ms") or {}).get("p95"), False),
+                    ("peak RSS", lambda result: result.get("peak_rss_mb"), False),
+                    ("server peak RSS", lambda result: result.get("server_peak_rss_mb"), False)]
+
+def compare_results(results, baseline, tolerance):
+    # Returns one line per metric that got worse than the baseline by more than tolerance
+    baseline_results = {(result["stage"], result["sf"]): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        key = (result["stage"], result["sf"])
+        label = f"{result['stage']} at SF={result['sf']:g}"
+        if "error" in result:
+            regressions.append(f"{label}: {result['error']}")
+        if "throughput" not in result:
+            continue
+        if key not in baseline_results or "throughput" not in baseline_results[key]:
+            print(f"{label}: no baseline")
+            continue
+        for name, metric, higher_is_better in compared_metrics:
+            value, previous = metric(result), metric(baseline_results[key])
+            if value is None or not previous:
+                continue
+            change = value / previous - 1
+            print(f"{label}: {name} {previous:.4g} -> {value:.4g} ({change:+.1%})")
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(f"{label}: {name} {previous:.4g} -> {value:.4g} ({change:+.1%})")
+    return regressions
+
+
+if __name__ == "__main__":
+    # e.g. `python benchmark.py --sf 1 --sf 10 --reset-database`, then
+    # `python benchmark.py --save-baseline` on a known-good commit to compare later runs against
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages and the customer API")
+    parser.add_argument("--stage", choices=stages, action="append", help="run only this stage (repeatable)")
+    parser.add_argument("--sf", type=float, action="append", help="scale factor (repeatable)")
+    parser.add_argument("--requests", type=int, default=default_api_requests, help="API requests per scale factor")
+    parser.add_argument("--concurrency", type=int, default=default_api_concurrency, help="concurrent API clients")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of the reload and refresh stages")
+    parser.add_argument("--tolerance", type=float, default=default_tolerance)
+    parser.add_argument("--output", default=results_path)
+    parser.add_argument("--baseline", default=baseline_path)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--reset-database", action="store_true",
+                        help="allow the load stage to drop and recreate every table in PGDATABASE")
+    parser.add_argument("--run-stage", choices=stages, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    options = {"requests": args.requests, "concurrency": args.concurrency, "repeat": args.repeat}
+
+    if args.run_stage:
+        measured = stage_functions[args.run_stage](args.sf[0], options)
+        with open(args.result_file, "w") as f:
+            json.dump(measured, f)
+        sys.exit(0)
+
+    selected_stages = args.stage or stages
+    if "load" in selected_stages and not args.reset_database:
+        parser.error("the load stage drops and recreates every table in PGDATABASE; "
+                     "pass --reset-database, or leave it out with --stage")
+
+    results = run_benchmarks(selected_stages, args.sf or default_scale_factors, options)
+    save_results(results, args.output)
+    print(f"Results written to {args.output}")
+
+    # Failed stages count as regressions whether or not there is a baseline
+    regressions = [f"{result['stage']} at SF={result['sf']:g}: {result['error']}"
+                   for result in results if "error" in result]
+    if args.save_baseline:
+        save_results(results, args.baseline)
+        print(f"Baseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare_results(results, json.load(f), args.tolerance)
+    else:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+
+    if regressions:
+        print("Regressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
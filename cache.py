@@ -0,0 +1,59 @@
+### Libraries
+import os
+import shutil
+import hashlib
+
+# Entries live in one directory per key; the least recently used ones are
+# evicted once the whole cache grows past max_cache_bytes
+cache_dir = os.environ.get("CDI_CACHE_DIR", ".cache/cdi")
+max_cache_bytes = int(os.environ.get("CDI_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+def make_cache_key(content_hash, version):
+    return hashlib.sha256(f"{content_hash}:{version}".encode()).hexdigest()
+
+def entry_dir(key):
+    return os.path.join(cache_dir, key)
+
+def load_frames(key, names):
+    import pandas as pd
+
+    directory = entry_dir(key)
+    paths = [os.path.join(directory, f"{name}.feather") for name in names]
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    frames = {name: pd.read_feather(path) for name, path in zip(names, paths)}
+    # The directory mtime doubles as the last-access time for eviction
+    os.utime(directory)
+    return frames
+
+def store_frames(key, frames):
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_dir = entry_dir(key) + f".tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, frame in frames.items():
+        frame.reset_index(drop=True).to_feather(os.path.join(tmp_dir, f"{name}.feather"))
+    shutil.rmtree(entry_dir(key), ignore_errors=True)
+    os.replace(tmp_dir, entry_dir(key))
+    evict()
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(dirpath, filename))
+               for dirpath, _, filenames in os.walk(directory)
+               for filename in filenames)
+
+def evict(max_bytes=None):
+    max_bytes = max_cache_bytes if max_bytes is None else max_bytes
+    entries = []
+    for name in os.listdir(cache_dir):
+        directory = os.path.join(cache_dir, name)
+        if os.path.isdir(directory) and ".tmp-" not in name:
+            entries.append((os.path.getmtime(directory), directory_size(directory), directory))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, directory in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(directory, ignore_errors=True)
+        total -= size
+        print(f"Evicted cache entry {os.path.basename(directory)} ({size} bytes)")
@@ -0,0 +1,99 @@
+### Libraries
+import numpy as np
+import pandas as pd
+import pyarrow.compute as pc
+from datalake import read_partitioned_dataset, dataset_hash
+from cache import make_cache_key, load_frames, store_frames
+
+# Bump cleaning_version whenever the cleaning below changes, so cached results are rebuilt
+cleaning_version = 2
+
+cdi_columns = ["yearstart", "yearend", "locationdesc", "topic", "question", "datavaluetype",
+               "stratificationcategory1", "stratification1", "datavalue"]
+categorical_columns = ["locationdesc", "topic", "question", "datavaluetype",
+                       "stratificationcategory1", "stratification1"]
+
+cached_frames = ["hospitalization_number", "mortality_number",
+                 "hospitalization_number_stats", "mortality_number_stats"]
+
+number_columns = {"yearend": "Year",
+                  "locationdesc": "State",
+                  "topic": "ChronicDiseaseCategory",
+                  "question": "ChronicDiseaseExplanation",
+                  "stratificationcategory1": "StratificationCategory",
+                  "stratification1": "Stratification",
+                  "datavalue": "{}Count"}
+
+### Loading Data
+# Only the columns, partitions and rows used by the forecasts are read
+def load_cdi_data(data_lake):
+    question = pc.utf8_lower(pc.field("question"))
+    data = read_partitioned_dataset(data_lake,
+                                    columns=cdi_columns,
+                                    partition_filter=lambda partition: partition["yearstart"] != 2001,
+                                    filter=((pc.field("datavaluetype") == "Number") &
+                                            pc.field("datavalue").is_valid() &
+                                            (pc.match_substring(question, "mortality") |
+                                             pc.match_substring(question, "hospital"))),
+                                    # Filtered columns stay plain strings for the pushed-down predicates
+                                    dictionary_columns=["locationdesc", "stratificationcategory1",
+                                                        "stratification1"])
+    for column in categorical_columns:
+        data[column] = data[column].astype("category")
+    data["yearstart"] = data["yearstart"].astype("Int16")
+    data["yearend"] = data["yearend"].astype("Int16")
+    data["datavalue"] = pd.to_numeric(data["datavalue"], errors="coerce")
+    return data
+
+### Data Cleaning/Processing
+def category_mask(series, predicate):
+    # The predicate runs once per distinct question instead of once per row;
+    # the appended False is picked up by the -1 code of missing values
+    hits = np.append(predicate(series.cat.categories.to_series()).to_numpy(dtype=bool), False)
+    return hits[series.cat.codes.to_numpy()]
+
+def number_frame(data, mask, name):
+    frame = data.loc[mask, list(number_columns)]
+    frame = frame.rename(columns={column: target.format(name) for column, target in number_columns.items()})
+    count_column = f"{name}Count"
+    frame[count_column] = np.trunc(frame[count_column]).astype("Int64")
+    return frame.reset_index(drop=True)
+
+def number_stats(frame, name):
+    count_column = f"{name}Count"
+    stats = frame.groupby(["Year", "State"], observed=True)[count_column].sum().reset_index()
+    stats["Year"] = stats["Year"].astype("int64")
+    stats["State"] = stats["State"].astype(str)
+    stats[count_column] = stats[count_column].astype("int64")
+    return stats.sort_values(["Year", "State"]).reset_index(drop=True)
+
+def clean_cdi_data(data):
+    data = data[data["datavalue"].notna().to_numpy() & (data["yearstart"] != 2001).fillna(True).to_numpy()]
+
+    question = data["question"].astype("category")
+    is_number = (data["datavaluetype"] == "Number").to_numpy()
+    no_rate = ~category_mask(question, lambda q: q.str.contains("rate", regex=False))
+    mortality = category_mask(question, lambda q: q.str.lower().str.contains("mortality", regex=False))
+    hospitalization = category_mask(question, lambda q: q.str.lower().str.contains("hospital", regex=False))
+    not_older_adults = (data["topic"] != "Older Adults").to_numpy()
+
+    hospitalization_number = number_frame(data, hospitalization & is_number & not_older_adults & no_rate,
+                                          "Hospitalization")
+    mortality_number = number_frame(data, mortality & is_number & no_rate, "Mortality")
+
+    return {"hospitalization_number": hospitalization_number,
+            "mortality_number": mortality_number,
+            "hospitalization_number_stats": number_stats(hospitalization_number, "Hospitalization"),
+            "mortality_number_stats": number_stats(mortality_number, "Mortality")}
+
+### Cached Loading
+# Data is loaded and cleaned unless a result for the same input and cleaning_version is cached
+def load_cleaned_frames(data_lake):
+    cache_key = make_cache_key(dataset_hash(data_lake), cleaning_version)
+    frames = load_frames(cache_key, cached_frames)
+    if frames is None:
+        frames = clean_cdi_data(load_cdi_data(data_lake))
+        store_frames(cache_key, frames)
+    else:
+        print(f"Using cached CDI data {cache_key[:12]}")
+    return frames
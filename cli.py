@@ -0,0 +1,111 @@
+### Libraries
+# Only the standard library is imported here. Every subcommand runs its script,
+# which imports what that step needs, so e.g. `python cli.py refresh` never loads
+# pandas, matplotlib, statsmodels, scikit-learn or the Azure SDK
+import os
+import sys
+import json
+import runpy
+import argparse
+import subprocess
+
+backend_dir = os.path.join("user-interface", "frontend", "backend")
+
+# Subcommand -> the script it runs as __main__; arguments after the subcommand are passed on
+commands = {
+    "download": {"script": "download-data.py",
+                 "help": "sync the Chronic Disease Indicators and upload them to the data lake"},
+    "forecast": {"script": "chronic-disease-prediction.py",
+                 "help": "clean the data and write data/ChronicDiseaseForecast.csv"},
+    "load": {"script": "fill-tables.py",
+             "help": "load the CSV files into PostgreSQL (e.g. `load --mode delta`)"},
+    "refresh": {"script": "reload-forecasts.py",
+                "help": "reload the forecasts and refresh the materialized views"},
+    "serve": {"script": os.path.join(backend_dir, "app.py"),
+              "path": backend_dir,
+              # The import check builds the app without a database behind it
+              "check_env": {"DATABASE_URL": "sqlite://"},
+              "help": "run the customer API"},
+    "pipeline": {"script": "database-pipeline.py",
+                 "help": "run the stages whose inputs changed (e.g. `pipeline --diff`)"},
+}
+
+### Import Budgets
+# Seconds a subcommand may spend importing its script before doing any work.
+# Only forecast needs the heavy libraries; it has no budget
+import_budgets = {"download": 1.0,
+                  "load": 0.5,
+                  "refresh": 0.5,
+                  "serve": 2.0,
+                  "pipeline": 0.2}
+heavy_modules = ["pandas", "matplotlib", "statsmodels", "sklearn", "azure"]
+
+# Runs in a fresh interpreter: imports the script without running its __main__ block
+import_check_code = """
+import json, runpy, sys, time
+sys.path.insert(0, {path!r})
+started = time.perf_counter()
+runpy.run_path({script!r}, run_name="cli_import_check")
+print(json.dumps({{"seconds": time.perf_counter() - started,
+                   "modules": sorted(name for name in sys.modules if "." not in name)}}))
+"""
+
+def measure_imports(command):
+    spec = commands[command]
+    code = import_check_code.format(path=os.path.abspath(spec.get("path", ".")), script=spec["script"])
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            env={**os.environ, **spec.get("check_env", {})})
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {spec['script']} failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def check_imports(names=None, budget_scale=1.0):
+    # Returns one line per subcommand that is over budget or loads a heavy library
+    failures = []
+    for command in names or import_budgets:
+        measured = measure_imports(command)
+        budget = import_budgets.get(command)
+        heavy = [module for module in heavy_modules if module in measured["modules"]] if budget else []
+        print(f"{command}: {measured['seconds']:.3f}s"
+              + (f" (budget {budget * budget_scale:.3f}s)" if budget else " (no budget)")
+              + (f", imports {', '.join(heavy)}" if heavy else ""))
+        if budget and measured["seconds"] > budget * budget_scale:
+            failures.append(f"{command} takes {measured['seconds']:.3f}s to import, "
+                            f"budget {budget * budget_scale:.3f}s")
+        if heavy:
+            failures.append(f"{command} imports {', '.join(heavy)}")
+    return failures
+
+### Running Subcommands
+def run_command(command, arguments):
+    spec = commands[command]
+    if "path" in spec:
+        sys.path.insert(0, spec["path"])
+    sys.argv = [spec["script"]] + arguments
+    runpy.run_path(spec["script"], run_name="__main__")
+
+
+if __name__ == "__main__":
+    # e.g. `python cli.py refresh`, `python cli.py load --mode delta`, `python cli.py check-imports`
+    parser = argparse.ArgumentParser(description="Run a step of the pipeline or the customer API")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command, spec in commands.items():
+        # Everything after the subcommand, --help included, is left to the script
+        subparsers.add_parser(command, help=spec["help"], add_help=False)
+    check_parser = subparsers.add_parser("check-imports", help="check the import time of every subcommand")
+    check_parser.add_argument("names", nargs="*", metavar="COMMAND", help="default: every subcommand with a budget")
+    check_parser.add_argument("--budget-scale", type=float, default=1.0,
+                              help="multiply every budget, e.g. 2 on a slow machine")
+    args, arguments = parser.parse_known_args()
+
+    if args.command == "check-imports":
+        if arguments:
+            parser.error(f"unrecognized arguments: {' '.join(arguments)}")
+        unknown = [name for name in args.names if name not in commands]
+        if unknown:
+            parser.error(f"unknown subcommand: {', '.join(unknown)}")
+        failures = check_imports(args.names, args.budget_scale)
+        for failure in failures:
+            print(f"Over budget: {failure}")
+        sys.exit(1 if failures else 0)
+    run_command(args.command, arguments)
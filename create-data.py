@@ -1,7 +1,15 @@
 ### Libraries
+import os
 import csv
 import random
+import math
 import string
+import shutil
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 
 ### Create Data
 def generate_policy_id(policy_name):
@@ -153,5 +161,485 @@ def create_all_csv_files(policy_filename, conditions_filename, providers_filenam
 
     print(f"CSV file '{providers_filename}' has been created successfully.")
 
-# Create all CSV files
-create_all_csv_files('data/Policy.csv', 'data/CoveredConditions.csv', 'data/InNetworkProviders.csv')
\ No newline at end of file
+### Scale-Factor Synthetic Data
+# SF=1 produces about as many rows as the CSVs in data/, SF=1000 a million customers.
+# Every block of rng_block_rows rows of every table has its own generator seeded
+# with (seed, table, block), and attributes that other tables reference (keys, the
+# dates inside composite foreign keys, the customer of a contract...) are pure
+# functions of the row index, so any chunk can be generated alone and in any order.
+# Chunks are whole blocks, so the output does not depend on the chunk size either
+base_rows = 1000
+rng_block_rows = 10000
+default_chunk_rows = 100000
+max_zip_codes = 90000
+
+synthetic_states = [
+    "Alabama", "Alaska", "Arizona", "Arkansas", "California", "Colorado", "Connecticut", "Delaware",
+    "District of Columbia", "Florida", "Georgia", "Hawaii", "Idaho", "Illinois", "Indiana", "Iowa",
+    "Kansas", "Kentucky", "Louisiana", "Maine", "Maryland", "Massachusetts", "Michigan", "Minnesota",
+    "Mississippi", "Missouri", "Montana", "Nebraska", "Nevada", "New Hampshire", "New Jersey",
+    "New Mexico", "New York", "North Carolina", "North Dakota", "Ohio", "Oklahoma", "Oregon",
+    "Pennsylvania", "Rhode Island", "South Carolina", "South Dakota", "Tennessee", "Texas", "Utah",
+    "Vermont", "Virginia", "Washington", "West Virginia", "Wisconsin", "Wyoming"
+]
+first_names = ["James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David",
+               "Elizabeth", "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah",
+               "Charles", "Karen", "Wilhelmina", "Edd", "Louisa", "Elsy", "Doti", "Ezri"]
+last_names = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez",
+              "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor",
+              "Moore", "Jackson", "Martin", "Fitzsymon", "Abeles", "Ghidoli", "Toffts", "Kennerley"]
+street_names = ["Melrose Road", "Leroy Circle", "Grayhawk Crossing", "Memorial Court", "Loftsgordon Drive",
+                "Utah Drive", "Bay Alley", "Columbus Road", "Oak Street", "Maple Avenue", "Pine Lane",
+                "Cedar Court", "Elm Street", "Washington Boulevard", "Lake Drive"]
+cities = ["Springfield", "Franklin", "Greenville", "Clinton", "Madison", "Georgetown", "Salem", "Fairview",
+          "Riverside", "Garden Grove", "Fort Pierce", "Arlington", "Ashland", "Dover", "Oxford"]
+genders = ["Female", "Male", "Non-binary"]
+email_domains = ["example.com", "mail.com", "inbox.org", "post.net"]
+claim_descriptions = ["Addison's disease hormone replacement", "Prostate cancer PSA level check",
+                      "Insulin pump supplies", "Cardiac stress test", "Pulmonary function test",
+                      "MRI brain scan", "Dialysis session", "Chemotherapy infusion", "Physical therapy",
+                      "Joint replacement follow-up"]
+claim_statuses = ["Approved", "Denied", "In Review", "Partially Approved", "Pending"]
+activity_statuses = ["Active", "Inactive", "Archived", "Suspended"]
+billing_methods = ["Self-Pay", "Time-Based Billing", "Electronic Billing", "Paper Billing"]
+coverage_types = ["Travel Health Insurance", "Point of Service (POS)", "Health Maintenance Organization (HMO)",
+                  "Preferred Provider Organization (PPO)", "Exclusive Provider Organization (EPO)"]
+card_types = ["visa", "mastercard", "amex", "maestro", "discover"]
+banking_account_types = ["Checking Account", "Savings Account", "Loan Account", "Certificate of Deposit (CD)"]
+premium_frequencies = ["Monthly", "Quarterly", "Annually", "Bi-Weekly"]
+payment_methods = ["Electronic Funds Transfer (EFT)", "In-Person Payments", "Credit Card", "Check"]
+premium_statuses = ["Active", "Overdue", "Suspended", "Cancelled"]
+invoice_statuses = ["Paid", "Unpaid", "Overdue", "Cancelled"]
+billing_periods = ["Monthly", "Bi-Weekly", "Quarterly", "Annually"]
+line_descriptions = ["Monthly Premium", "Overage Charge", "Contract Termination Fee", "Late Payment Fee",
+                     "Policy Adjustment", "Service Charge"]
+
+# Partitioned tables take dates from 2010-01-01 to 2024-12-31 (Claim_p1..p3, Account_p1..p3, Invoice_p1..p3)
+partition_start = np.datetime64("2010-01-01")
+partition_days = int((np.datetime64("2025-01-01") - partition_start).astype(int))
+
+def splitmix64(values):
+    with np.errstate(over="ignore"):
+        z = values.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+def index_hash(seed, name, index):
+    # Deterministic 64-bit hash of (seed, name, row index), vectorized over index
+    salt = int.from_bytes(hashlib.blake2b(f"{seed}:{name}".encode(), digest_size=8).digest(), "little")
+    with np.errstate(over="ignore"):
+        return splitmix64(np.asarray(index, dtype=np.uint64) ^ np.uint64(salt))
+
+def hashed_choice(seed, name, index, size):
+    return (index_hash(seed, name, index) % np.uint64(size)).astype(np.int64)
+
+def digits(values, width):
+    return pd.Series(np.asarray(values, dtype=np.int64)).astype(str).str.zfill(width)
+
+def format_dates(days, start=partition_start):
+    # Day offsets from start as M/D/YYYY, the format of the CSVs in data/
+    dates = start + np.asarray(days, dtype="timedelta64[D]")
+    years = dates.astype("datetime64[Y]").astype(np.int64) + 1970
+    months = dates.astype("datetime64[M]").astype(np.int64) % 12 + 1
+    month_days = (dates - dates.astype("datetime64[M]")).astype(np.int64) + 1
+    return (pd.Series(months).astype(str) + "/" + pd.Series(month_days).astype(str) + "/"
+            + pd.Series(years).astype(str))
+
+def partition_dates(seed, name, index):
+    return hashed_choice(seed, name, index, partition_days)
+
+def format_ssn(numbers):
+    text = digits(numbers, 9)
+    return text.str[:3] + "-" + text.str[3:5] + "-" + text.str[5:]
+
+def permutation_multiplier(modulus):
+    # Near the golden ratio of the modulus and coprime to it, which is what makes
+    # index * multiplier a bijection on [0, modulus)
+    multiplier = int(modulus * 0.6180339887) | 1
+    while math.gcd(multiplier, modulus) != 1:
+        multiplier += 2
+    return multiplier
+
+def permuted(seed, name, index, modulus):
+    # Affine bijection on [0, modulus): unique ids that do not look sequential
+    offset = int.from_bytes(hashlib.blake2b(f"{seed}:{name}".encode(), digest_size=8).digest(), "little") % modulus
+    return (np.asarray(index, dtype=np.int64) * permutation_multiplier(modulus) + offset) % modulus
+
+def phones(rng, size):
+    return digits(rng.integers(200, 1000, size), 3) + "-" + digits(rng.integers(0, 1000, size), 3) + "-" \
+        + digits(rng.integers(0, 10000, size), 4)
+
+def streets(rng, size):
+    return pd.Series(rng.integers(1, 99999, size)).astype(str) + " " + \
+        pd.Series(np.array(street_names, dtype=object)[rng.integers(0, len(street_names), size)])
+
+def pick(rng, values, size):
+    return np.array(values, dtype=object)[rng.integers(0, len(values), size)]
+
+def money(rng, low, high, size):
+    return np.round(rng.uniform(low, high, size), 2)
+
+# Keys and referenced attributes, shared by the tables that point at them
+def zip_code(seed, index):
+    return digits(permuted(seed, "zip", index, max_zip_codes) + 10000, 5)
+
+def customer_ssn(seed, index):
+    return format_ssn(permuted(seed, "customer", index, 10 ** 9))
+
+def participant_ssn(seed, index):
+    return format_ssn(permuted(seed, "participant", index, 10 ** 9))
+
+def contract_number(index):
+    index = np.asarray(index, dtype=np.int64)
+    return "CNT-CDP-" + pd.Series(index // 1000).astype(str) + "-" + digits(index % 1000, 3)
+
+def account_number(index):
+    return "ACC" + digits(index, 9)
+
+def billing_account_number(index):
+    return "BILL" + digits(index, 9)
+
+def invoice_number(index):
+    return "INVC-" + digits(index, 8)
+
+def policy_ids(seed):
+    numbers = index_hash(seed, "policy", np.arange(len(policies))) % np.uint64(10 ** 6)
+    return [f"CDP-{''.join(word[0].upper() for word in policy['name'].split() if word[0].isalpha())}-{int(number):06d}"
+            for policy, number in zip(policies, numbers)]
+
+def contract_customer(seed, index, counts):
+    return hashed_choice(seed, "contract.customer", index, counts["customer"])
+
+def account_established_days(seed, index):
+    return partition_dates(seed, "account.established", index)
+
+def invoice_days(seed, index):
+    return partition_dates(seed, "invoice.date", index)
+
+def invoice_line_base(seed, index):
+    return hashed_choice(seed, "invoice.lines", index, 120)
+
+### Table Generators
+# Each returns the rows [start, stop) of its table as a DataFrame in CSV column order
+def generate_postalcode(rng, seed, start, stop, counts):
+    index = np.arange(start, stop)
+    return pd.DataFrame({"Zip": zip_code(seed, index),
+                         "City": pick(rng, cities, len(index)),
+                         "State": pick(rng, synthetic_states, len(index))})
+
+def person_columns(rng, size, email_suffix):
+    first = pick(rng, first_names, size)
+    last = pick(rng, last_names, size)
+    emails = (pd.Series(first).str[0].str.lower() + pd.Series(last).str.lower() + email_suffix + "@"
+              + pd.Series(pick(rng, email_domains, size)))
+    return first, last, emails
+
+def generate_prospect(rng, seed, start, stop, counts):
+    index = np.arange(start, stop)
+    size = len(index)
+    first, last, emails = person_columns(rng, size, pd.Series(index).astype(str))
+    return pd.DataFrame({"ProspectID": index + 1,
+                         "FirstName": first,
+                         "LastName": last,
+                         "Street": streets(rng, size),
+                         "ContactDate": format_dates(rng.integers(0, partition_days, size)),
+                         "Phone": phones(rng, size),
+                         "DOB": format_dates(rng.integers(-25000, -2000, size)),
+                         "Gender": pick(rng, genders, size),
+                         "EmailAddress": emails,
+                         "Zip": zip_code(seed, rng.integers(0, counts["postalcode"], size))})
+
+def generate_customer(rng, seed, start, stop, counts):
+    index = np.arange(start, stop)
+    size = len(index)
+    first, last, emails = person_columns(rng, size, "c" + pd.Series(index).astype(str))
+    return pd.DataFrame({"CustomerSSN": customer_ssn(seed, index),
+                         "FirstName": first,
+                         "LastName": last,
+                         "Street": streets(rng, size),
+                         "Phone": phones(rng, size),
+                         "DOB": format_dates(rng.integers(-25000, -2000, size)),
+                         "Gender": pick(rng, genders, size),
+                         "EmailAddress": emails,
+                         "Zip": zip_code(seed, rng.integers(0, counts["postalcode"], size)),
+                         # Customer i converted from prospect i
+                         "ProspectID": index % counts["prospect"] + 1})
+
+def generate_participantclaimant(rng, seed, start, stop, counts):
+    index = np.arange(start, stop)
+    size = len(index)
+    first, last, emails = person_columns(rng, size, "p" + pd.Series(index).astype(str))
+    return pd.DataFrame({"ParticipantSSN": participant_ssn(seed, index),
+                         "CustomerSSN": customer_ssn(seed, rng.integers(0, counts["customer"], size)),
+                         "FirstName": first,
+                         "LastName": last,
+                         "DOB": format_dates(rng.integers(-30000, 0, size)),
+                         "Gender": pick(rng, genders, size),
+                         "EmailAddress": emails,
+                         "Street": streets(rng, size),
+                         "Zip": zip_code(seed, rng.integers(0, counts["postalcode"], size))})
+
+def generate_policy(rng, seed, start, stop, counts):
+    size = len(policies)
+    return pd.DataFrame({"PolicyID": policy_ids(seed),
+                         "PolicyName": [policy["name"] for policy in policies],
+                         "MaximumLifeTimeBenefit": pick(rng, [1000000, 2000000, 3000000, 5000000, 10000000], size),
+                         "RenewalTerms": pick(rng, ["Annual", "Bi-annual", "5-year"], size),
+                         "Copayment": pick(rng, [10, 15, 20, 25, 30, 40, 50], size),
+                         "CoInsuranceRate": pick(rng, [10, 15, 20, 25, 30], size),
+                         "Deductible": pick(rng, [500, 1000, 1500, 2000, 2500, 3000, 5000], size)})
+
+def generate_contract(rng, seed, start, stop, counts):
+    index = np.arange(start, stop)
+    size = len(index)
+    effective = rng.integers(0, partition_days, size)
+    return pd.DataFrame({"ContractNumber": contract_number(index),
+                         "ContractType": pick(rng, ["Individual", "Group"], size),
+                         "GroupNumber": "GRP-" + digits(rng.integers(0, 10 ** 6, size), 6),
+                         "EffectiveDate": format_dates(effective),
+                         "ExpirationDate": format_dates(effective + 365),
+                         "RenewalDate": format_dates(effective + rng.integers(300, 900, size)),
+                         "PolicyID": pick(rng, policy_ids(seed), size),
+                         "CustomerSSN": customer_ssn(seed, contract_customer(seed, index, counts))})
+
+def generate_coveredconditions(rng, seed, start, stop, counts):
+    rows = [(policy_id, condition) for policy_id, policy in zip(policy_ids(seed), policies)
+            for condition in policy["conditions"]]
+    return pd.DataFrame(rows, columns=["PolicyID", "CoveredCondition"])
+
+def generate_innetworkproviders(rng, seed, start, stop, counts):
+    rows = [(policy_id, providers[provider]) for policy_id in policy_ids(seed)
+            for provider in rng.choice(len(providers), 5, replace=False)]
+    return pd.DataFrame(rows, columns=["PolicyID", "InNetworkProvider"])
+
+def generate_coveredby(rng, seed, start, stop, counts):
+    index = np.arange(start, stop)
+    # Row i covers participant i, so the (participant, contract) key is unique
+    return pd.DataFrame({"ParticipantSSN": participant_ssn(seed, index % counts["participantclaimant"]),
+                         "ContractNumber": contract_number(rng.integers(0, counts["contract"], len(index)))})
+
+def generate_claim(rng, seed, start, stop, counts):
+    index = np.arange(start, stop)
+    size = len(index)
+    claim_days = rng.integers(0, partition_days, size)
+    return pd.DataFrame({"ClaimNumber": "CLM-" + digits(index // 10 ** 6, 4) + "-" + digits(index % 10 ** 6, 6),
+                         "DateOfService": format_dates(np.maximum(claim_days - rng.integers(0, 365, size), 0)),
+                         "DateOfClaim": format_dates(claim_days),
+                         "SettlementDate": format_dates(claim_days + rng.integers(0, 365, size)),
+                         "ClaimDescription": pick(rng, claim_descriptions, size),
+                         "ClaimAmount": money(rng, 100, 99999999, size),
+                         "ClaimStatus": pick(rng, claim_statuses, size),
+                         "ParticipantSSN": participant_ssn(seed, rng.integers(0, counts["participantclaimant"], size)),
+                         "ContractNumber": contract_number(rng.integers(0, counts["contract"], size))})
+
+def generate_account(rng, seed, start, stop, counts):
+    index = np.arange(start, stop)
+    size = len(index)
+    established = account_established_days(seed, index)
+    return pd.DataFrame({"AcctNumber": account_number(index),
+                         "CustomerSSN": customer_ssn(seed, rng.integers(0, counts["customer"], size)),
+                         "NoMonthsInactive": rng.integers(0, 120, size),
+                         "ActivityStatus": pick(rng, activity_statuses, size),
+                         "ActivityStatusDate": format_dates(established + rng.integers(0, 1500, size)),
+                         "AccountEstablishedDate": format_dates(established)})
+
+def generate_operation(rng, seed, start, stop, counts):
+    index = np.arange(start, stop)
+    size = len(index)
+    letters = np.array(list(string.ascii_uppercase), dtype=object)
+    names = pd.Series(letters[rng.integers(0, 26, size)])
+    for _ in range(3):
+        names = names + letters[rng.integers(0, 26, size)]
+    return pd.DataFrame({"GeoCode": digits(index // 1000, 5) + "-" + digits(index % 1000, 3),
+                         "OperationName": names + digits(rng.integers(0, 100, size), 2)})
+
+def generate_billingaccount(rng, seed, start, stop, counts):
+    index = np.arange(start, stop)
+    size = len(index)
+    account = rng.integers(0, counts["account"], size)
+    established = account_established_days(seed, account)
+    return pd.DataFrame({"BAcctNumber": billing_account_number(index),
+                         "AcctNumber": account_number(account),
+                         "BillingStreet": streets(rng, size),
+                         "BillingAptNo": rng.integers(1, 100, size),
+                         "BillingZip": zip_code(seed, rng.integers(0, counts["postalcode"], size)),
+                         "BillingPhone": phones(rng, size),
+                         "BillingMethod": pick(rng, billing_methods, size),
+                         "OnlineBillingFlag": pick(rng, ["T", "F"], size),
+                         "CoverageType": pick(rng, coverage_types, size),
+                         "LastInvoiceGenDate": format_dates(rng.integers(0, partition_days, size)),
+                         "LastInvoicePaidDueDate": format_dates(rng.integers(0, partition_days, size)),
+                         "LastInvoicePaidDate": format_dates(rng.integers(0, partition_days, size)),
+                         "LastBillCount": rng.integers(0, 30, size),
+                         "NextInvoiceGenDate": format_dates(rng.integers(0, partition_days, size)),
+                         "CardType": pick(rng, card_types, size),
+                         "CardNo": digits(rng.integers(10 ** 15, 10 ** 16, size), 16),
+                         "CardExpirationDate": format_dates(rng.integers(partition_days, partition_days + 2000, size)),
+                         "BankingAccountType": pick(rng, banking_account_types, size),
+                         "BankingAccountNumber": digits(rng.integers(0, 10 ** 10, size), 10),
+                         "PaymentAmount": money(rng, 10, 999.99, size),
+                         "PaymentDate": format_dates(rng.integers(0, partition_days, size)),
+                         # Must match the referenced account's key
+                         "AccountEstablishedDate": format_dates(established)})
+
+def generate_chronicdiseaseforecast(rng, seed, start, stop, counts):
+    size = len(synthetic_states)
+    mortality = rng.integers(1000, 300000, size)
+    hospitalization = rng.integers(1000, 300000, size)
+    mortality_change = np.round(rng.uniform(-0.5, 0.5, size), 2)
+    hospitalization_change = np.round(rng.uniform(-0.5, 0.9, size), 2)
+    return pd.DataFrame({"State": synthetic_states,
+                         "MortalityCountCurrentYear": mortality,
+                         "MortalityCountNextYear": np.round(mortality * (1 + mortality_change)).astype(np.int64),
+                         "HospitalizationCountCurrentYear": hospitalization,
+                         "HospitalizationCountNextYear": np.round(hospitalization * (1 + hospitalization_change)).astype(np.int64),
+                         "MortalityChange": mortality_change,
+                         "HospitalizationChange": hospitalization_change,
+                         "PremiumAmountIncreaseRate": np.round(rng.uniform(0.05, 0.30, size), 2)})
+
+def generate_contractpremium(rng, seed, start, stop, counts):
+    index = np.arange(start, stop)
+    size = len(index)
+    contract = rng.integers(0, counts["contract"], size)
+    return pd.DataFrame({"PremiumCode": "PREM" + pd.Series(index).astype(str),
+                         "ContractNumber": contract_number(contract),
+                         # The premium is paid by the contract's customer
+                         "CustomerSSN": customer_ssn(seed, contract_customer(seed, contract, counts)),
+                         "PremiumAmount": rng.integers(100, 10000, size),
+                         "PremiumFrequency": pick(rng, premium_frequencies, size),
+                         "PaymentMethod": pick(rng, payment_methods, size),
+                         "Status": pick(rng, premium_statuses, size)})
+
+def generate_invoice(rng, seed, start, stop, counts):
+    index = np.arange(start, stop)
+    size = len(index)
+    days = invoice_days(seed, index)
+    contract = rng.integers(0, counts["contract"], size)
+    return pd.DataFrame({"InvoiceNumber": invoice_number(index),
+                         "InvoiceDate": format_dates(days),
+                         "NoOutstandingInvoices": rng.integers(0, 10, size),
+                         "DueDate": format_dates(days + rng.integers(15, 60, size)),
+                         "PaidDate": format_dates(days + rng.integers(0, 90, size)),
+                         "InvoiceStatus": pick(rng, invoice_statuses, size),
+                         "BillingPeriod": pick(rng, billing_periods, size),
+                         "BAcctNumber": billing_account_number(rng.integers(0, counts["billingaccount"], size)),
+                         "CustomerSSN": customer_ssn(seed, contract_customer(seed, contract, counts)),
+                         "ContractNumber": contract_number(contract)})
+
+def generate_invoicedetail(rng, seed, start, stop, counts):
+    index = np.arange(start, stop)
+    size = len(index)
+    # Row i is line i // invoices of invoice i % invoices; line numbers start at a per-invoice
+    # offset so they spread over all InvoiceDetail partitions while staying unique per invoice
+    invoice = index % counts["invoice"]
+    line_number = invoice_line_base(seed, invoice) + (index // counts["invoice"]) * 120 + 1
+    return pd.DataFrame({"InvoiceNumber": invoice_number(invoice),
+                         "InvoiceDate": format_dates(invoice_days(seed, invoice)),
+                         "LineNumber": line_number,
+                         "LineDescription": pick(rng, line_descriptions, size),
+                         "LineTotal": money(rng, 1, 9999.99, size)})
+
+# Same order as csv_files in fill-tables.py; the position is part of every chunk's seed
+synthetic_tables = [
+    ("PostalCode", generate_postalcode),
+    ("Prospect", generate_prospect),
+    ("Customer", generate_customer),
+    ("ParticipantClaimant", generate_participantclaimant),
+    ("Policy", generate_policy),
+    ("Contract", generate_contract),
+    ("CoveredConditions", generate_coveredconditions),
+    ("InNetworkProviders", generate_innetworkproviders),
+    ("CoveredBy", generate_coveredby),
+    ("Claim", generate_claim),
+    ("Account", generate_account),
+    ("Operation", generate_operation),
+    ("BillingAccount", generate_billingaccount),
+    ("ChronicDiseaseForecast", generate_chronicdiseaseforecast),
+    ("ContractPremium", generate_contractpremium),
+    ("Invoice", generate_invoice),
+    ("InvoiceDetail", generate_invoicedetail),
+]
+
+def synthetic_row_counts(sf):
+    rows = int(round(base_rows * sf))
+    counts = {table.lower(): rows for table, _ in synthetic_tables}
+    counts["postalcode"] = min(rows, max_zip_codes)
+    counts["policy"] = len(policies)
+    counts["coveredconditions"] = sum(len(policy["conditions"]) for policy in policies)
+    counts["innetworkproviders"] = len(policies) * 5
+    counts["chronicdiseaseforecast"] = len(synthetic_states)
+    counts["operation"] = min(rows, 10 ** 8)
+    return counts
+
+def generate_chunk(task):
+    # Writes one chunk of one table to its own part file and returns the row count
+    table_index, chunk, start, stop, seed, counts, part_path = task
+    table, generate = synthetic_tables[table_index]
+    frames = []
+    for block_start in range(start, stop, rng_block_rows):
+        rng = np.random.default_rng([seed, table_index, block_start // rng_block_rows])
+        frames.append(generate(rng, seed, block_start, min(block_start + rng_block_rows, stop), counts))
+    frame = pd.concat(frames, ignore_index=True)
+    frame.to_csv(part_path, index=False, header=chunk == 0)
+    return len(frame)
+
+def generate_synthetic_data(sf, seed=0, workers=None, chunk_rows=default_chunk_rows, output_dir=None):
+    output_dir = output_dir or f"data/synthetic-sf{sf:g}"
+    workers = workers or os.cpu_count() or 1
+    # Rounded up to whole generator blocks
+    chunk_rows = max(1, -(-chunk_rows // rng_block_rows)) * rng_block_rows
+    counts = synthetic_row_counts(sf)
+    os.makedirs(output_dir, exist_ok=True)
+
+    tasks = []
+    parts = {}
+    for table_index, (table, _) in enumerate(synthetic_tables):
+        # Small fixed tables come out of a single chunk whatever their size
+        fixed = table.lower() in ("policy", "coveredconditions", "innetworkproviders", "chronicdiseaseforecast")
+        total = 1 if fixed else counts[table.lower()]
+        step = total if fixed else chunk_rows
+        parts[table] = []
+        for chunk, start in enumerate(range(0, total, step)):
+            part_path = os.path.join(output_dir, f"{table}.csv.part{chunk:05d}")
+            parts[table].append(part_path)
+            tasks.append((table_index, chunk, start, min(start + step, total), seed, counts, part_path))
+
+    if workers <= 1 or len(tasks) <= 1:
+        rows = list(map(generate_chunk, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            rows = list(executor.map(generate_chunk, tasks))
+
+    # Parts are concatenated in chunk order, so the output does not depend on the worker count
+    written = dict.fromkeys(parts, 0)
+    for task, row_count in zip(tasks, rows):
+        written[synthetic_tables[task[0]][0]] += row_count
+    for table, part_paths in parts.items():
+        with open(os.path.join(output_dir, f"{table}.csv"), "wb") as output:
+            for part_path in part_paths:
+                with open(part_path, "rb") as part:
+                    shutil.copyfileobj(part, output)
+                os.remove(part_path)
+        print(f"{table}: {written[table]} rows")
+    print(f"Synthetic data for SF={sf:g} written to {output_dir}")
+    return output_dir
+
+
+if __name__ == "__main__":
+    # Without --sf, only the policy CSVs in data/ are recreated, as before.
+    # With it, every table is generated, e.g. `python create-data.py --sf 100 --seed 7`
+    # and loaded with `DATA_DIR=data/synthetic-sf100 python fill-tables.py`
+    parser = argparse.ArgumentParser(description="Create the policy CSVs or a full synthetic dataset")
+    parser.add_argument("--sf", type=float, default=None, help="scale factor; SF=1 is the size of data/")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-rows", type=int, default=default_chunk_rows)
+    parser.add_argument("--output-dir", default=None)
+    args = parser.parse_args()
+
+    if args.sf is None:
+        # Create all CSV files
+        create_all_csv_files('data/Policy.csv', 'data/CoveredConditions.csv', 'data/InNetworkProviders.csv')
+    else:
+        generate_synthetic_data(args.sf, args.seed, args.workers, args.chunk_rows, args.output_dir)
@@ -1,25 +1,95 @@
--- Materialized view of Invoice
-CREATE MATERIALIZED VIEW LastInvoiceDetailsPerCustomer AS
-SELECT 
-    CustomerSSN,
-    MAX(InvoiceDate) as LastInvoiceDate,
-    DueDate,
-    PaidDate,
-    InvoiceStatus,
-    NoOutstandingInvoices
-FROM Invoice i1
-WHERE InvoiceDate = (
-    SELECT MAX(InvoiceDate)
-    FROM Invoice i2
-    WHERE i2.CustomerSSN = i1.CustomerSSN
-)
-GROUP BY 
+-- Last invoice per customer
+-- A summary table with one row per customer instead of a materialized view, kept
+-- current by statement-level triggers on Invoice: every INSERT, UPDATE, DELETE or
+-- COPY recomputes only the customers it touched, so maintenance cost follows the
+-- size of the change rather than the whole invoice history.
+-- Ties on the last InvoiceDate are broken by the highest InvoiceNumber.
+CREATE TABLE LastInvoiceDetailsPerCustomer (
+    CustomerSSN CHAR(11) PRIMARY KEY,
+    LastInvoiceDate DATE NOT NULL,
+    InvoiceNumber VARCHAR(20) NOT NULL,
+    DueDate DATE,
+    PaidDate DATE,
+    InvoiceStatus VARCHAR(20),
+    NoOutstandingInvoices INT
+);
+
+-- Serves the latest-row-per-customer lookups below from the index alone
+CREATE INDEX IX_Invoice_CustomerSSN_InvoiceDate ON Invoice(CustomerSSN, InvoiceDate DESC, InvoiceNumber DESC);
+
+CREATE OR REPLACE FUNCTION refresh_last_invoice_details(customer_ssns CHAR(11)[])
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM LastInvoiceDetailsPerCustomer
+    WHERE CustomerSSN = ANY(customer_ssns);
+
+    INSERT INTO LastInvoiceDetailsPerCustomer
+    SELECT DISTINCT ON (CustomerSSN)
+        CustomerSSN,
+        InvoiceDate,
+        InvoiceNumber,
+        DueDate,
+        PaidDate,
+        InvoiceStatus,
+        NoOutstandingInvoices
+    FROM Invoice
+    WHERE CustomerSSN = ANY(customer_ssns)
+    ORDER BY CustomerSSN, InvoiceDate DESC, InvoiceNumber DESC;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition tables can only be declared for one event per trigger, so the three
+-- triggers share this function and name their tables old_invoices / new_invoices
+CREATE OR REPLACE FUNCTION maintain_last_invoice_details()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM refresh_last_invoice_details(ARRAY(SELECT DISTINCT CustomerSSN FROM new_invoices));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM refresh_last_invoice_details(ARRAY(SELECT CustomerSSN FROM old_invoices
+                                                   UNION
+                                                   SELECT CustomerSSN FROM new_invoices));
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM refresh_last_invoice_details(ARRAY(SELECT DISTINCT CustomerSSN FROM old_invoices));
+    ELSIF TG_OP = 'TRUNCATE' THEN
+        TRUNCATE LastInvoiceDetailsPerCustomer;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER TR_Invoice_LastInvoiceDetails_Insert
+AFTER INSERT ON Invoice
+REFERENCING NEW TABLE AS new_invoices
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_last_invoice_details();
+
+CREATE TRIGGER TR_Invoice_LastInvoiceDetails_Update
+AFTER UPDATE ON Invoice
+REFERENCING OLD TABLE AS old_invoices NEW TABLE AS new_invoices
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_last_invoice_details();
+
+CREATE TRIGGER TR_Invoice_LastInvoiceDetails_Delete
+AFTER DELETE ON Invoice
+REFERENCING OLD TABLE AS old_invoices
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_last_invoice_details();
+
+CREATE TRIGGER TR_Invoice_LastInvoiceDetails_Truncate
+AFTER TRUNCATE ON Invoice
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_last_invoice_details();
+
+-- One-off backfill of the invoices loaded before the triggers existed
+INSERT INTO LastInvoiceDetailsPerCustomer
+SELECT DISTINCT ON (CustomerSSN)
     CustomerSSN,
+    InvoiceDate,
+    InvoiceNumber,
     DueDate,
     PaidDate,
     InvoiceStatus,
     NoOutstandingInvoices
-ORDER BY CustomerSSN;
+FROM Invoice
+ORDER BY CustomerSSN, InvoiceDate DESC, InvoiceNumber DESC
+ON CONFLICT (CustomerSSN) DO NOTHING;
 
 
 -- Materialized view of Customer + Contract
@@ -61,4 +131,12 @@ CREATE MATERIALIZED VIEW CustomerContract AS
 	JOIN ChronicDiseaseForecast
 	ON Customer.state = ChronicDiseaseForecast.state
 	
-	ORDER BY Contract.customerssn, Contract.contractnumber;
\ No newline at end of file
+	ORDER BY Contract.customerssn, Contract.contractnumber;
+
+-- One row per contract premium: (premiumcode, contractnumber) is the key of ContractPremium
+CREATE UNIQUE INDEX UX_CustomerContract
+ON CustomerContract (customerssn, contractnumber, premiumcode);
+
+-- Contract listings and exports filter by state (/api/contracts?state=...)
+CREATE INDEX IX_CustomerContract_State
+ON CustomerContract (state);
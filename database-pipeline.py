@@ -1,81 +1,245 @@
-import psycopg2
-import csv
-from psycopg2 import sql
-
-# Download Chronic Disaese Indicators data from http://cdc.gov
-# Upload that data into the data lake in Microsoft Azure
-with open('download-data.py') as file:
-    exec(file.read())
-
-# Download the Chronic Disease Indicators data from Microsoft Azure 
-# Preprocess/clean it, use it as an input to the time series forecasting model 
-# Obtain the forecasts and store it in the data folder as a .csv file (ChronicDiseaseForecast.csv).
-with open('chronic-disease-prediction.py') as file:
-    exec(file.read())
-
-# Database connection parameters
-db_params = {
-    "host": "localhost",
-    "database": "postgres",
-    "user": "postgres",
-    "password": "secret_password"
-}
-# CSV file path
-csv_file_path = 'data/ChronicDiseaseForecast.csv'
-
-def get_column_names(cursor, table_name):
-    cursor.execute(f"SELECT * FROM {table_name} LIMIT 0")
-    return [desc[0] for desc in cursor.description]
-
-try:
-    # Connect to the database
-    conn = psycopg2.connect(**db_params)
-    cur = conn.cursor()
-
-    # 1. Empty the ChronicDiseaseForecast table
-    cur.execute("TRUNCATE TABLE ChronicDiseaseForecast;")
-
-    # Get column names from the table
-    columns = get_column_names(cur, 'ChronicDiseaseForecast')
-
-    # 2. Fill the table with CSV data
-    with open(csv_file_path, 'r') as f:
-        csv_reader = csv.reader(f)
-        header = next(csv_reader)  # Read the header row
-        
-        # Create the INSERT query dynamically
-        insert_query = sql.SQL("INSERT INTO ChronicDiseaseForecast ({}) VALUES ({})").format(
-            sql.SQL(', ').join(map(sql.Identifier, columns)),
-            sql.SQL(', ').join(sql.Placeholder() * len(columns))
-        )
-        
-        for row in csv_reader:
-            # Ensure the row has the correct number of elements
-            if len(row) != len(columns):
-                print(f"Skipping row {csv_reader.line_num}: incorrect number of fields")
+### Libraries
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+from utils import load_json, save_json, max_rss_mb
+
+### Pipeline Stages
+# Every stage is a script run in its own process. A stage runs once the stages it
+# depends on have finished, and is skipped when its script, its inputs, its arguments,
+# its environment and the settings named in env_inputs have the same fingerprint as
+# when it last succeeded. Stages without inputs (the download, whose input is upstream,
+# and the refresh, whose input is the database) always run. Independent stages run at
+# the same time; rows names the CSV whose row count is reported for the stage
+pipeline_stages = [
+    {"name": "download",
+     # Downloads the Chronic Disease Indicators from http://cdc.gov (only what changed
+     # since the last sync) and uploads them to the data lake in Microsoft Azure
+     "script": "download-data.py",
+     "inputs": [],
+     "outputs": ["data/chronic-disease-indicators.csv"],
+     "depends_on": [],
+     "rows": "data/chronic-disease-indicators.csv"},
+    {"name": "forecast",
+     # Cleans the data from the data lake and writes the forecasts to data/ChronicDiseaseForecast.csv;
+     # the charts are left to the plots stage
+     "script": "chronic-disease-prediction.py",
+     # The manifest holds the hash of the data the download stage uploaded
+     "inputs": ["data/cdi-parquet/_manifest.json", "datalake.py", "cleaning.py", "cache.py", "forecasting.py",
+                "plotting.py", "data/ForecastOrderSelection.csv"],
+     "outputs": ["data/ChronicDiseaseForecast.csv"],
+     "depends_on": ["download"],
+     "env": {"FORECAST_PLOTS": "0"},
+     "env_inputs": ["FORECAST_METHOD", "FORECAST_COMPARE", "DATA_LAKE_BACKEND", "DATA_LAKE_PATH"],
+     "rows": "data/ChronicDiseaseForecast.csv"},
+    {"name": "plots",
+     "script": "plotting.py",
+     "inputs": ["data/cdi-parquet/_manifest.json", "data/ChronicDiseaseForecast.csv", "datalake.py",
+                "cleaning.py", "cache.py"],
+     "outputs": [],
+     "env_inputs": ["DATA_LAKE_BACKEND", "DATA_LAKE_PATH"],
+     "depends_on": ["forecast"]},
+    {"name": "reload",
+     # Swaps the forecasts into ChronicDiseaseForecast
+     "script": "reload-forecasts.py",
+     "args": ["--reload-only"],
+     "inputs": ["data/ChronicDiseaseForecast.csv"],
+     "outputs": [],
+     "depends_on": ["forecast"],
+     "rows": "data/ChronicDiseaseForecast.csv"},
+    {"name": "refresh",
+     # Refreshes the materialized views and tells the API to drop its cached customer
+     # profiles. The views also read the tables that fill-tables.py loads, so this
+     # runs even when the forecasts are unchanged
+     "script": "reload-forecasts.py",
+     "args": ["--refresh-only"],
+     "inputs": [],
+     "outputs": [],
+     "depends_on": ["reload"]},
+]
+
+# Fingerprint of every stage's last successful run
+pipeline_state_path = os.environ.get("PIPELINE_STATE", ".pipeline-state.json")
+# One JSON line per run with the profile of every stage
+pipeline_history_path = os.environ.get("PIPELINE_HISTORY", "pipeline-history.jsonl")
+pipeline_workers = int(os.environ.get("PIPELINE_WORKERS", len(pipeline_stages)))
+
+fingerprint_block_size = 8 * 1024 * 1024
+
+### State and Fingerprints
+def stage_fingerprint(stage):
+    # Missing inputs are part of the fingerprint too, so creating one re-runs the stage
+    hasher = hashlib.sha256()
+    env = {**os.environ, **stage.get("env", {})}
+    settings = {name: env.get(name) for name in stage.get("env_inputs", [])}
+    hasher.update(json.dumps([stage.get("args", []), stage.get("env", {}), settings], sort_keys=True).encode())
+    for path in [stage["script"]] + stage["inputs"]:
+        hasher.update(path.encode() + b"\x00")
+        if not os.path.exists(path):
+            hasher.update(b"missing")
+            continue
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(fingerprint_block_size), b""):
+                hasher.update(block)
+    return hasher.hexdigest()
+
+def is_unchanged(stage, fingerprint, state):
+    return (bool(stage["inputs"]) and state.get(stage["name"]) == fingerprint
+            and all(os.path.exists(path) for path in stage["outputs"]))
+
+def csv_row_count(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return max(0, sum(1 for _ in f) - 1)
+
+### Scheduling
+def start_stage(stage):
+    env = {**os.environ, **stage.get("env", {})}
+    print(f"Starting {stage['name']}: {' '.join([stage['script']] + stage.get('args', []))}")
+    return subprocess.Popen([sys.executable, stage["script"]] + stage.get("args", []), env=env)
+
+def stage_profile(stage, status, fingerprint, started=None, rusage=None):
+    profile = {"stage": stage["name"], "status": status, "fingerprint": fingerprint}
+    if rusage is not None:
+        wall_seconds = time.perf_counter() - started
+        rows = csv_row_count(stage.get("rows"))
+        profile.update({"wall_seconds": wall_seconds,
+                        "cpu_seconds": rusage.ru_utime + rusage.ru_stime,
+                        "peak_rss_mb": max_rss_mb(rusage),
+                        "rows": rows,
+                        "rows_per_second": rows / wall_seconds if rows is not None and wall_seconds else None})
+    return profile
+
+def run_pipeline(stages=None, force=(), workers=None):
+    # Returns the profile of every stage in pipeline order
+    stages = pipeline_stages if stages is None else stages
+    workers = pipeline_workers if workers is None else workers
+    state = load_json(pipeline_state_path, {})
+    names = [stage["name"] for stage in stages]
+    pending = list(stages)
+    running = {}
+    profiles = {}
+
+    while pending or running:
+        for stage in list(pending):
+            dependencies = [profiles.get(name) for name in stage["depends_on"] if name in names]
+            if any(profile is None for profile in dependencies):
                 continue
-            
-            try:
-                cur.execute(insert_query, row)
-            except psycopg2.Error as e:
-                print(f"Error inserting row {csv_reader.line_num}: {e}")
+            if len(running) >= max(1, workers):
+                break
+            pending.remove(stage)
+            if any(profile["status"] in ("failed", "blocked") for profile in dependencies):
+                profiles[stage["name"]] = stage_profile(stage, "blocked", None)
+                print(f"Not running {stage['name']}: a stage it depends on did not succeed")
+                continue
+
+            # Taken after the dependencies finished, so it covers what they wrote
+            fingerprint = stage_fingerprint(stage)
+            if stage["name"] not in force and "all" not in force and is_unchanged(stage, fingerprint, state):
+                profiles[stage["name"]] = stage_profile(stage, "skipped", fingerprint)
+                print(f"Skipping {stage['name']}: inputs unchanged")
+                continue
+            process = start_stage(stage)
+            running[process.pid] = (stage, process, fingerprint, time.perf_counter())
+
+        if not running:
+            continue
+        # Reaps whichever stage finishes first, with its own CPU time and peak memory
+        pid, status, rusage = os.wait4(-1, 0)
+        if pid not in running:
+            continue
+        stage, process, fingerprint, started = running.pop(pid)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        succeeded = process.returncode == 0
+        profile = stage_profile(stage, "ran" if succeeded else "failed", fingerprint, started, rusage)
+        profiles[stage["name"]] = profile
+        if succeeded:
+            state[stage["name"]] = fingerprint
+            save_json(state, pipeline_state_path, indent=2)
+        print(f"{'Finished' if succeeded else 'Failed'} {stage['name']} in {profile['wall_seconds']:.1f}s "
+              f"(CPU {profile['cpu_seconds']:.1f}s, peak RSS {profile['peak_rss_mb']:.0f} MB)")
+
+    return [profiles[name] for name in names]
+
+### Run History
+def record_run(profiles, started_at, wall_seconds):
+    run = {"run_id": time.strftime("%Y%m%dT%H%M%S", time.localtime(started_at)),
+           "started": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(started_at)),
+           "wall_seconds": wall_seconds,
+           "stages": profiles}
+    with open(pipeline_history_path, "a") as f:
+        f.write(json.dumps(run) + "\n")
+    return run
+
+def load_history():
+    if not os.path.exists(pipeline_history_path):
+        return []
+    with open(pipeline_history_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def format_value(value, unit):
+    return "-" if value is None else f"{value:.1f}{unit}"
+
+def format_change(before, after, unit):
+    change = f" ({after / before - 1:+.0%})" if before and after is not None else ""
+    return f"{format_value(before, unit)} -> {format_value(after, unit)}{change}"
 
-    # 3. Refresh materialized view LastInvoiceDetailsPerCustomer
-    cur.execute("REFRESH MATERIALIZED VIEW LastInvoiceDetailsPerCustomer;")
+def diff_runs(before, after):
+    # Stage by stage comparison of two runs from the history
+    print(f"Run {before['run_id']} -> {after['run_id']}: "
+          f"{format_change(before['wall_seconds'], after['wall_seconds'], 's')}")
+    before_stages = {profile["stage"]: profile for profile in before["stages"]}
+    for profile in after["stages"]:
+        previous = before_stages.get(profile["stage"], {})
+        print(f"  {profile['stage']}: {previous.get('status', '-')} -> {profile['status']}")
+        for key, label, unit in [("wall_seconds", "wall", "s"), ("cpu_seconds", "cpu", "s"),
+                                 ("peak_rss_mb", "peak RSS", " MB"), ("rows_per_second", "rows/s", "")]:
+            if previous.get(key) is not None or profile.get(key) is not None:
+                print(f"    {label}: {format_change(previous.get(key), profile.get(key), unit)}")
 
-    # 4. Refresh materialized view CustomerContract
-    cur.execute("REFRESH MATERIALIZED VIEW CustomerContract;")
+def find_run(history, run_id):
+    for run in history:
+        if run["run_id"] == run_id:
+            return run
+    sys.exit(f"No run {run_id} in {pipeline_history_path}")
 
-    # Commit the changes
-    conn.commit()
 
-    print("All operations completed successfully.")
+if __name__ == "__main__":
+    # `python database-pipeline.py` runs the stages whose inputs changed,
+    # `--force forecast` re-runs one regardless and `--diff` compares the last two runs
+    parser = argparse.ArgumentParser(description="Run the forecasting pipeline")
+    parser.add_argument("--stage", choices=[stage["name"] for stage in pipeline_stages], action="append",
+                        help="run only this stage (repeatable)")
+    parser.add_argument("--force", action="append", default=[],
+                        help="run this stage even if its inputs are unchanged ('all' for every stage)")
+    parser.add_argument("--workers", type=int, default=None, help="stages run at the same time")
+    parser.add_argument("--diff", nargs="*", metavar="RUN_ID",
+                        help="compare two runs from the history (default: the last two)")
+    args = parser.parse_args()
 
-except (Exception, psycopg2.Error) as error:
-    print("Error while connecting to PostgreSQL or executing operations:", error)
+    if args.diff is not None:
+        history = load_history()
+        if args.diff:
+            if len(args.diff) != 2:
+                parser.error("--diff takes two run ids, or none for the last two runs")
+            runs = [find_run(history, run_id) for run_id in args.diff]
+        elif len(history) < 2:
+            sys.exit(f"{pipeline_history_path} has fewer than two runs")
+        else:
+            runs = history[-2:]
+        diff_runs(*runs)
+        sys.exit(0)
 
-finally:
-    if conn:
-        cur.close()
-        conn.close()
-        print("PostgreSQL connection is closed")
\ No newline at end of file
+    stages = [stage for stage in pipeline_stages if args.stage is None or stage["name"] in args.stage]
+    started_at = time.time()
+    started = time.perf_counter()
+    profiles = run_pipeline(stages, force=set(args.force), workers=args.workers)
+    run = record_run(profiles, started_at, time.perf_counter() - started)
+    print(f"Run {run['run_id']} recorded in {pipeline_history_path}")
+    if any(profile["status"] in ("failed", "blocked") for profile in profiles):
+        sys.exit(1)
@@ -0,0 +1,216 @@
+### Libraries
+import io
+import os
+import csv
+import json
+import base64
+import hashlib
+import shutil
+from urllib.parse import unquote
+from utils import atomic_write
+
+# Both backends move data in blocks of this size, so memory stays flat
+# no matter how large the uploaded or downloaded file is
+block_size = 8 * 1024 * 1024
+
+# The CDI dataset is stored as Parquet, partitioned by year and topic
+dataset_prefix = "chronic-disease-indicators"
+partition_columns = {"yearstart": int, "topic": str}
+int_columns = ["yearstart", "yearend"]
+manifest_name = "_manifest.json"
+
+### Local Filesystem Backend
+class LocalDataLake:
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, blob_name):
+        return os.path.join(self.root, blob_name)
+
+    def upload_file(self, local_path, blob_name):
+        target = self.path(blob_name)
+        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+        with open(local_path, "rb") as src, atomic_write(target, "wb") as dst:
+            shutil.copyfileobj(src, dst, block_size)
+
+    def delete_blob(self, blob_name):
+        os.remove(self.path(blob_name))
+
+    def open_blob(self, blob_name):
+        return open(self.path(blob_name), "rb", buffering=block_size)
+
+    def list_blobs(self, prefix=""):
+        names = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                name = os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, "/")
+                if name.startswith(prefix) and not name.endswith(".tmp"):
+                    names.append(name)
+        return sorted(names)
+
+### Azure Blob Storage Backend
+class BlobChunkStream(io.RawIOBase):
+    # File-like view over the chunk iterator of a blob download
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.buffer:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.buffer = memoryview(chunk)
+        n = min(len(b), len(self.buffer))
+        b[:n] = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+        return n
+
+class AzureDataLake:
+    def __init__(self, connection_string, container_name):
+        from azure.storage.blob import BlobServiceClient
+        self.service_client = BlobServiceClient.from_connection_string(connection_string,
+                                                                       max_single_get_size=block_size,
+                                                                       max_chunk_get_size=block_size)
+        self.container_name = container_name
+
+    def blob_client(self, blob_name):
+        return self.service_client.get_blob_client(container=self.container_name, blob=blob_name)
+
+    def upload_file(self, local_path, blob_name):
+        from azure.storage.blob import BlobBlock
+        blob_client = self.blob_client(blob_name)
+        block_list = []
+        with open(local_path, "rb") as f:
+            while True:
+                data = f.read(block_size)
+                if not data:
+                    break
+                block_id = base64.b64encode(f"{len(block_list):08d}".encode()).decode()
+                blob_client.stage_block(block_id, data, length=len(data))
+                block_list.append(BlobBlock(block_id=block_id))
+        blob_client.commit_block_list(block_list)
+
+    def delete_blob(self, blob_name):
+        self.blob_client(blob_name).delete_blob()
+
+    def open_blob(self, blob_name):
+        downloader = self.blob_client(blob_name).download_blob()
+        return io.BufferedReader(BlobChunkStream(downloader.chunks()), buffer_size=block_size)
+
+    def list_blobs(self, prefix=""):
+        container_client = self.service_client.get_container_client(self.container_name)
+        return sorted(blob.name for blob in container_client.list_blobs(name_starts_with=prefix))
+
+def get_data_lake():
+    # DATA_LAKE_BACKEND=local keeps everything under DATA_LAKE_PATH for offline runs
+    if os.environ.get("DATA_LAKE_BACKEND", "azure") == "local":
+        return LocalDataLake(os.environ.get("DATA_LAKE_PATH", "data-lake"))
+    connection_string = os.environ.get("AZURE_STORAGE_CONNECTION_STRING", "secret_connection_string")
+    return AzureDataLake(connection_string, "data-lake")
+
+### Partitioned Parquet Dataset
+def write_partitioned_dataset(csv_path, local_dir):
+    import pyarrow as pa
+    import pyarrow.csv as pv
+    import pyarrow.dataset as ds
+
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        header = next(csv.reader(f))
+    # Explicit types keep every streamed block on the same schema
+    column_types = {column: pa.int64() if column in int_columns else pa.string() for column in header}
+    reader = pv.open_csv(csv_path,
+                         read_options=pv.ReadOptions(block_size=64 * 1024 * 1024),
+                         convert_options=pv.ConvertOptions(column_types=column_types,
+                                                           strings_can_be_null=True))
+
+    shutil.rmtree(local_dir, ignore_errors=True)
+    partitioning = ds.partitioning(pa.schema([(column, column_types[column]) for column in partition_columns]),
+                                   flavor="hive")
+    ds.write_dataset(reader, local_dir,
+                     format="parquet",
+                     partitioning=partitioning,
+                     file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+                     basename_template="part-{i}.parquet",
+                     existing_data_behavior="overwrite_or_ignore")
+
+    # The content hash of the source lets readers key caches without reading the data
+    with open(os.path.join(local_dir, manifest_name), "w") as f:
+        json.dump({"sha256": file_hash(csv_path)}, f)
+
+def file_hash(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def dataset_hash(data_lake, prefix=dataset_prefix):
+    blob_names = data_lake.list_blobs(prefix + "/")
+    if f"{prefix}/{manifest_name}" in blob_names:
+        with data_lake.open_blob(f"{prefix}/{manifest_name}") as stream:
+            return json.load(stream)["sha256"]
+    hasher = hashlib.sha256()
+    for blob_name in blob_names:
+        hasher.update(blob_name.encode())
+        with data_lake.open_blob(blob_name) as stream:
+            for block in iter(lambda: stream.read(block_size), b""):
+                hasher.update(block)
+    return hasher.hexdigest()
+
+def upload_dataset(data_lake, local_dir, prefix=dataset_prefix):
+    uploaded = set()
+    for dirpath, _, filenames in os.walk(local_dir):
+        for filename in filenames:
+            relative = os.path.relpath(os.path.join(dirpath, filename), local_dir).replace(os.sep, "/")
+            blob_name = f"{prefix}/{relative}"
+            data_lake.upload_file(os.path.join(dirpath, filename), blob_name)
+            uploaded.add(blob_name)
+    # Partitions that disappeared upstream must not linger in the lake
+    for blob_name in data_lake.list_blobs(prefix + "/"):
+        if blob_name not in uploaded:
+            data_lake.delete_blob(blob_name)
+
+def parse_partition(blob_name, prefix):
+    partition = {}
+    for segment in blob_name[len(prefix) + 1:].split("/")[:-1]:
+        key, _, value = segment.partition("=")
+        partition[key] = partition_columns[key](unquote(value))
+    return partition
+
+def read_partitioned_dataset(data_lake, columns, partition_filter=None, filter=None,
+                             dictionary_columns=None, prefix=dataset_prefix):
+    # partition_filter prunes whole files by their year/topic, filter is a
+    # pyarrow expression pushed down to the Parquet row groups and
+    # dictionary_columns are decoded straight into pandas categoricals
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    file_columns = [column for column in columns if column not in partition_columns]
+    file_dictionary_columns = [column for column in dictionary_columns or [] if column in file_columns]
+    tables = []
+    for blob_name in data_lake.list_blobs(prefix + "/"):
+        if not blob_name.endswith(".parquet"):
+            continue
+        partition = parse_partition(blob_name, prefix)
+        if partition_filter and not partition_filter(partition):
+            continue
+        with data_lake.open_blob(blob_name) as stream:
+            source = stream if stream.seekable() else io.BytesIO(stream.read())
+            table = pq.read_table(source, columns=file_columns, filters=filter,
+                                  read_dictionary=file_dictionary_columns)
+        for column in columns:
+            if column in partition:
+                value = partition[column]
+                array = pa.array([value] * table.num_rows, pa.int64() if isinstance(value, int) else pa.string())
+                if dictionary_columns and column in dictionary_columns:
+                    array = array.dictionary_encode()
+                table = table.append_column(column, array)
+        tables.append(table.select(columns))
+
+    if not tables:
+        return pa.table({column: [] for column in columns}).to_pandas()
+    return pa.concat_tables(tables).to_pandas()
@@ -0,0 +1,128 @@
+### Libraries
+import os
+import csv
+import math
+import hashlib
+import tempfile
+
+# Rows are deduplicated by primary key with last-wins semantics. Only a 16-byte
+# fingerprint per key is kept in memory; once those no longer fit in
+# dedup_memory_bytes the file is split into hash partitions on disk instead
+dedup_memory_bytes = int(os.environ.get("DEDUP_MEMORY_BYTES", 256 * 1024 ** 2))
+dedup_tmp_dir = os.environ.get("DEDUP_TMP_DIR") or None
+
+# Approximate size of one fingerprint -> row index entry in a dict
+fingerprint_entry_bytes = 120
+# Parsed rows take about this many times their size on disk
+row_memory_factor = 16
+max_partitions = 256
+fingerprint_space = 2 ** 128
+
+def key_fingerprint(row, key_indexes):
+    hasher = hashlib.blake2b(digest_size=16)
+    for index in key_indexes:
+        hasher.update(row[index].encode())
+        hasher.update(b"\x00")
+    return hasher.digest()
+
+def read_header(csv_file):
+    with open(csv_file, 'r', newline='') as f:
+        return next(csv.reader(f), None)
+
+def read_rows(path, skip_header=True):
+    # Blank lines are skipped, as csv.DictReader does
+    with open(path, 'r', newline='') as f:
+        reader = csv.reader(f)
+        if skip_header:
+            next(reader, None)
+        for row in reader:
+            if row:
+                yield row
+
+### In-Memory Fingerprints
+def last_row_indexes(csv_file, key_indexes, memory_bytes):
+    # First pass: fingerprint -> index of the last row with that key, or None
+    # when the fingerprints outgrow the budget
+    max_entries = max(1, memory_bytes // fingerprint_entry_bytes)
+    last_rows = {}
+    for row_index, row in enumerate(read_rows(csv_file)):
+        last_rows[key_fingerprint(row, key_indexes)] = row_index
+        if len(last_rows) > max_entries:
+            return None
+    return last_rows
+
+def fingerprint_rows(csv_file, key_indexes, last_rows):
+    # Second pass: only the last row of every key is kept
+    for row_index, row in enumerate(read_rows(csv_file)):
+        if last_rows[key_fingerprint(row, key_indexes)] == row_index:
+            yield row
+
+### Disk-Backed Partitions
+def fits_in_memory(path, memory_bytes):
+    return row_memory_factor * os.path.getsize(path) <= memory_bytes
+
+def split_rows(rows, key_indexes, size, memory_bytes, divisor, tmp_dir, prefix):
+    # Every key lands in exactly one partition. The partition is a digit of the
+    # fingerprint below divisor, so a partition split again uses a different slice
+    # of the hash than the split that produced it
+    partition_count = min(max_partitions, max(2, math.ceil(row_memory_factor * size / memory_bytes)))
+    paths = [os.path.join(tmp_dir, f"{prefix}{index:03d}.csv") for index in range(partition_count)]
+    files = [open(path, 'w', newline='') for path in paths]
+    try:
+        writers = [csv.writer(partition_file) for partition_file in files]
+        for row in rows:
+            fingerprint = int.from_bytes(key_fingerprint(row, key_indexes), "little")
+            writers[fingerprint // divisor % partition_count].writerow(row)
+    finally:
+        for partition_file in files:
+            partition_file.close()
+    return paths, divisor * partition_count
+
+def partition_unique_rows(path, key_indexes):
+    unique_rows = {}
+    for row in read_rows(path, skip_header=False):
+        # Re-inserting moves a key behind the ones seen since, as in file order
+        fingerprint = key_fingerprint(row, key_indexes)
+        unique_rows.pop(fingerprint, None)
+        unique_rows[fingerprint] = row
+    return unique_rows.values()
+
+def deduplicate_partitions(paths, parent_size, key_indexes, memory_bytes, divisor, tmp_dir):
+    # A partition still over the budget is split again, unless the fingerprint has
+    # no digits left or the split made no progress (a single key repeated)
+    for path in paths:
+        size = os.path.getsize(path)
+        if fits_in_memory(path, memory_bytes) or divisor >= fingerprint_space or size >= parent_size:
+            yield from partition_unique_rows(path, key_indexes)
+            os.remove(path)
+            continue
+        prefix = os.path.basename(path)[:-len(".csv")] + "-"
+        sub_paths, sub_divisor = split_rows(read_rows(path, skip_header=False), key_indexes, size,
+                                            memory_bytes, divisor, tmp_dir, prefix)
+        os.remove(path)
+        yield from deduplicate_partitions(sub_paths, size, key_indexes, memory_bytes, sub_divisor, tmp_dir)
+
+def partition_rows(csv_file, key_indexes, memory_bytes):
+    # Each partition is deduplicated on its own; partitions are split until their
+    # parsed rows fit in the budget
+    size = os.path.getsize(csv_file)
+    with tempfile.TemporaryDirectory(prefix="dedup-", dir=dedup_tmp_dir) as tmp_dir:
+        paths, divisor = split_rows(read_rows(csv_file), key_indexes, size, memory_bytes, 1, tmp_dir, "part-")
+        yield from deduplicate_partitions(paths, size, key_indexes, memory_bytes, divisor, tmp_dir)
+
+### Deduplication
+def deduplicated_rows(csv_file, pk_columns, memory_bytes=None):
+    # Returns the header and an iterator over the last row of every primary key,
+    # as lists in header order. Rows come out in file order of their last
+    # occurrence, or grouped by partition once the file has been spilled to disk
+    memory_bytes = dedup_memory_bytes if memory_bytes is None else memory_bytes
+    headers = read_header(csv_file)
+    if headers is None:
+        return [], iter(())
+    key_indexes = [headers.index(column) for column in pk_columns]
+
+    last_rows = last_row_indexes(csv_file, key_indexes, memory_bytes)
+    if last_rows is not None:
+        return headers, fingerprint_rows(csv_file, key_indexes, last_rows)
+    print(f"Deduplicating {csv_file} through disk partitions")
+    return headers, partition_rows(csv_file, key_indexes, memory_bytes)
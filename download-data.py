@@ -1,52 +1,291 @@
 ### Libraries
 import requests
 import json
-import pandas as pd
+import os
+import csv
 import time
-import io
-from azure.storage.blob import BlobServiceClient
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datalake import get_data_lake, write_partitioned_dataset, upload_dataset
+from utils import atomic_write, load_json, save_json
 
 ### Download Data
-def fetch_cdi_data(limit=50000, offset=0):
-    url = f"https://data.cdc.gov/resource/g4ie-h725.json?$limit={limit}&$offset={offset}"
-    response = requests.get(url)
-    return response.json()
-
-def download_all_cdi_data():
-    all_data = []
-    offset = 0
-    limit = 50000
-    
-    while True:
-        print(f"Downloading rows {offset} to {offset + limit}")
-        data_chunk = fetch_cdi_data(limit, offset)
-        
-        if not data_chunk:
-            break
-        
-        all_data.extend(data_chunk)
-        offset += len(data_chunk)
-        
-        if len(data_chunk) < limit:
-            break
-        
-        time.sleep(2)  # Increased delay due to larger chunks
-    
-    print(f"Total rows downloaded: {len(all_data)}")
-    return all_data
-
-
-cdi_data = download_all_cdi_data()
-
-cdi_df = pd.DataFrame(cdi_data)
-
-cdi_df.to_csv("data/chronic-disease-indicators.csv", index=False)
-
-### Uploading Data to Data Lake in Microsoft Azure
-csv_content = cdi_df.to_csv(index=False)
-connection_string = "secret_connection_string"
-blob_service_client = BlobServiceClient.from_connection_string(connection_string)
-container_name = "data-lake"
-blob_name = "chronic-disease-indicators.csv"
-blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
-blob_client.upload_blob(csv_content, blob_type="BlockBlob", overwrite=True)
\ No newline at end of file
+# The endpoint can be pointed at a local stand-in server through CDI_URL
+cdi_url = os.environ.get("CDI_URL", "https://data.cdc.gov/resource/g4ie-h725.json")
+page_dir = "data/cdi-pages"
+checkpoint_path = os.path.join(page_dir, "checkpoint.json")
+output_path = "data/chronic-disease-indicators.csv"
+parquet_dir = "data/cdi-parquet"
+sync_state_path = "data/cdi-sync-state.json"
+
+# "auto" syncs incrementally once a previous download left a high-water mark,
+# "full" always downloads the whole dataset again
+sync_mode = os.environ.get("CDI_SYNC_MODE", "auto")
+
+page_size = 50000
+max_workers = 4
+requests_per_second = 2
+max_retries = 5
+
+_thread_state = threading.local()
+
+def get_session():
+    # requests.Session is not thread safe, so every worker keeps its own
+    if not hasattr(_thread_state, "session"):
+        _thread_state.session = requests.Session()
+    return _thread_state.session
+
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+# System fields (:id, :updated_at) are selected so that later syncs can merge by row id
+def fetch_cdi_data(limit=50000, offset=0, url=None, rate_limiter=None, where=None, order=":id"):
+    params = {"$select": ":*, *", "$limit": limit, "$offset": offset, "$order": order}
+    if where:
+        params["$where"] = where
+    for attempt in range(max_retries):
+        if rate_limiter:
+            rate_limiter.wait()
+        try:
+            response = get_session().get(url or cdi_url, params=params, timeout=120)
+            if response.status_code == 429 or response.status_code >= 500:
+                raise requests.HTTPError(f"HTTP {response.status_code}", response=response)
+            response.raise_for_status()
+            return response.json()
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+            if e.response is not None and 400 <= e.response.status_code < 500 and e.response.status_code != 429:
+                raise
+            if attempt == max_retries - 1:
+                raise
+            delay = 2 ** attempt
+            print(f"Retrying rows {offset} to {offset + limit} in {delay}s: {e}")
+            time.sleep(delay)
+
+def fetch_cdi_count(url=None, where=None):
+    params = {"$select": "count(*)"}
+    if where:
+        params["$where"] = where
+    response = get_session().get(url or cdi_url, params=params, timeout=120)
+    response.raise_for_status()
+    return int(next(iter(response.json()[0].values())))
+
+def load_checkpoint(limit, where, order):
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        # Offsets only line up again if the page size and the query are unchanged
+        if (checkpoint.get("limit") == limit and checkpoint.get("where") == where
+                and checkpoint.get("order", ":id") == order):
+            return checkpoint
+    return {"limit": limit, "where": where, "order": order, "pages": {}}
+
+def save_checkpoint(checkpoint):
+    save_json(checkpoint, checkpoint_path)
+
+def page_path(offset):
+    return os.path.join(page_dir, f"page-{offset:09d}.jsonl")
+
+def write_page(offset, rows):
+    # Columns are recorded in first-seen order since Socrata omits null fields.
+    # The last row is the latest (:updated_at, :id) pair on the page
+    columns = {}
+    last_row = None
+    with atomic_write(page_path(offset)) as f:
+        for row in rows:
+            columns.update(dict.fromkeys(row))
+            if row.get(":updated_at") and (last_row is None or row_position(row) > row_position(last_row)):
+                last_row = row
+            f.write(json.dumps(row))
+            f.write("\n")
+    if last_row is None:
+        return list(columns), None, None
+    return list(columns), last_row[":updated_at"], last_row[":id"]
+
+def row_position(row):
+    return row[":updated_at"], row[":id"]
+
+def download_page(offset, limit, url, rate_limiter, where, order):
+    print(f"Downloading rows {offset} to {offset + limit}")
+    rows = fetch_cdi_data(limit, offset, url, rate_limiter, where, order)
+    columns, max_updated_at, last_id = write_page(offset, rows)
+    return offset, len(rows), columns, max_updated_at, last_id
+
+def download_all_cdi_data(limit=page_size, workers=max_workers, rate=requests_per_second, url=None, where=None,
+                          order=":id"):
+    os.makedirs(page_dir, exist_ok=True)
+    checkpoint = load_checkpoint(limit, where, order)
+    total = fetch_cdi_count(url, where)
+    checkpoint["total"] = total
+
+    pending = [offset for offset in range(0, total, limit)
+               if str(offset) not in checkpoint["pages"] or not os.path.exists(page_path(offset))]
+    if len(pending) < len(range(0, total, limit)):
+        print(f"Resuming download: {len(pending)} of {len(range(0, total, limit))} pages left")
+
+    rate_limiter = RateLimiter(rate)
+    checkpoint_lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(download_page, offset, limit, url, rate_limiter, where, order)
+                   for offset in pending]
+        for future in as_completed(futures):
+            offset, row_count, columns, max_updated_at, last_id = future.result()
+            with checkpoint_lock:
+                checkpoint["pages"][str(offset)] = {"rows": row_count,
+                                                    "columns": columns,
+                                                    "max_updated_at": max_updated_at,
+                                                    "last_id": last_id}
+                save_checkpoint(checkpoint)
+
+    row_count = sum(page["rows"] for page in checkpoint["pages"].values())
+    print(f"Total rows downloaded: {row_count}")
+    return checkpoint
+
+def read_page_rows(offsets):
+    for offset in offsets:
+        with open(page_path(offset)) as f:
+            for line in f:
+                yield json.loads(line)
+
+def page_columns(checkpoint, offsets, columns=None):
+    columns = dict.fromkeys(columns or [])
+    for offset in offsets:
+        columns.update(dict.fromkeys(checkpoint["pages"][str(offset)]["columns"]))
+    return list(columns)
+
+def high_water_mark(checkpoint, previous=(None, None)):
+    # The latest (:updated_at, :id) pair downloaded so far; the next sync starts after it
+    marks = [(page["max_updated_at"], page.get("last_id") or "")
+             for page in checkpoint["pages"].values() if page.get("max_updated_at")]
+    if previous[0]:
+        marks.append((previous[0], previous[1] or ""))
+    return max(marks) if marks else (None, None)
+
+def rows_after(mark, last_id):
+    # Rows stamped with the mark itself are told apart by :id, so a dataset published
+    # with one :updated_at for every row is not downloaded again by each sync
+    return (f":updated_at > '{mark}' OR "
+            f"(:updated_at = '{mark}' AND :id > '{last_id}')")
+
+def clear_pages(checkpoint):
+    for offset in checkpoint["pages"]:
+        os.remove(page_path(int(offset)))
+    os.remove(checkpoint_path)
+
+def assemble_pages(checkpoint, path):
+    offsets = sorted(int(offset) for offset in checkpoint["pages"])
+    columns = page_columns(checkpoint, offsets)
+
+    with atomic_write(path, newline="", encoding="utf-8") as out:
+        writer = csv.DictWriter(out, fieldnames=columns, restval="")
+        writer.writeheader()
+        for row in read_page_rows(offsets):
+            writer.writerow(row)
+    clear_pages(checkpoint)
+
+def csv_value(value):
+    return "" if value is None else str(value)
+
+def merge_pages(checkpoint, path):
+    # Rows are keyed by the Socrata row id; changed rows replace their old version.
+    # Only the delta is held in memory. Rows touched upstream without a change in
+    # their values are not counted
+    offsets = sorted(int(offset) for offset in checkpoint["pages"])
+    fetched_ids = set(row[":id"] for row in read_page_rows(offsets))
+
+    with open(path, newline="", encoding="utf-8") as f:
+        existing_columns = next(csv.reader(f))
+    columns = page_columns(checkpoint, offsets, existing_columns)
+
+    replaced = {}
+    # The source is closed before the new file replaces it
+    with atomic_write(path, newline="", encoding="utf-8") as out, \
+         open(path, newline="", encoding="utf-8") as src:
+        writer = csv.DictWriter(out, fieldnames=columns, restval="")
+        writer.writeheader()
+        for row in csv.DictReader(src):
+            if row[":id"] in fetched_ids:
+                replaced[row[":id"]] = row
+                continue
+            writer.writerow(row)
+        updated = new = 0
+        for row in read_page_rows(offsets):
+            writer.writerow(row)
+            old_row = replaced.get(row[":id"])
+            if old_row is None:
+                new += 1
+            elif any(csv_value(row.get(column)) != old_row.get(column, "") for column in columns):
+                updated += 1
+    clear_pages(checkpoint)
+
+    print(f"Merged {len(fetched_ids)} fetched rows ({updated} updated, {new} new, "
+          f"{len(fetched_ids) - updated - new} unchanged)")
+    return updated + new
+
+def load_sync_state():
+    return load_json(sync_state_path, {})
+
+def save_sync_state(state):
+    save_json(state, sync_state_path)
+
+def sync_cdi_data(mode=sync_mode):
+    # Returns the number of rows that changed in the local copy. A copy that changed
+    # is marked as not uploaded until the data lake has it, so an upload that did not
+    # happen (e.g. the run crashed after the merge) is retried by the next run
+    state = load_sync_state()
+    incremental = (mode != "full" and state.get("high_water_mark") is not None
+                   and os.path.exists(output_path))
+
+    if not incremental:
+        checkpoint = download_all_cdi_data()
+        row_count = sum(page["rows"] for page in checkpoint["pages"].values())
+        mark, last_id = high_water_mark(checkpoint)
+        assemble_pages(checkpoint, output_path)
+        save_sync_state({"high_water_mark": mark, "last_id": last_id, "uploaded": False})
+        return row_count
+
+    # A state saved without last_id fetches the rows at the mark once more
+    mark, last_id = state["high_water_mark"], state.get("last_id") or ""
+    print(f"Syncing rows updated after {mark} (row {last_id or '-'})")
+    checkpoint = download_all_cdi_data(where=rows_after(mark, last_id), order=":updated_at, :id")
+    if not checkpoint["pages"]:
+        print("No upstream changes")
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        return 0
+
+    new_mark, new_last_id = high_water_mark(checkpoint, (mark, last_id))
+    changed = merge_pages(checkpoint, output_path)
+    # Copies synced before the flag existed count as uploaded
+    uploaded = state.get("uploaded", True) and not changed
+    save_sync_state({"high_water_mark": new_mark, "last_id": new_last_id, "uploaded": uploaded})
+    if not changed:
+        print("No upstream changes")
+    return changed
+
+def upload_cdi_data():
+    data_lake = get_data_lake()
+    data_lake.upload_file(output_path, "chronic-disease-indicators.csv")
+    write_partitioned_dataset(output_path, parquet_dir)
+    upload_dataset(data_lake, parquet_dir)
+    save_sync_state({**load_sync_state(), "uploaded": True})
+
+
+if __name__ == "__main__":
+    sync_cdi_data()
+
+    ### Uploading Data to Data Lake in Microsoft Azure
+    if not load_sync_state().get("uploaded", True):
+        upload_cdi_data()
+    else:
+        print("Data lake is up to date")
@@ -15,4 +15,4 @@ BEGIN
 END $$;
 
 -- DROP MATERIALIZED VIEW customercontract;
--- DROP MATERIALIZED VIEW lastinvoicedetailspercustomer;
\ No newline at end of file
+-- lastinvoicedetailspercustomer is a table and is dropped above
\ No newline at end of file
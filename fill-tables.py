@@ -1,190 +1,378 @@
 ### Libraries
-import pandas as pd
 import csv
-from collections import OrderedDict
+import io
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 import os
-import psycopg2
+from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
+from dedup import deduplicated_rows
 
 ### Inserting Data into Tables
 db_params = {
-    "host": "localhost",
-    "database": "postgres",
-    "user": "postgres",
-    "password": "secret_password"
+    "host": os.environ.get("PGHOST", "localhost"),
+    "database": os.environ.get("PGDATABASE", "postgres"),
+    "user": os.environ.get("PGUSER", "postgres"),
+    "password": os.environ.get("PGPASSWORD", "secret_password")
 }
 
+# Number of pooled connections that COPY files into their staging tables at the same time
+load_workers = int(os.environ.get("LOAD_WORKERS", 4))
+
+# "full" inserts into empty tables, "delta" merges into the existing rows and only
+# touches the ones whose content changed
+load_mode = os.environ.get("LOAD_MODE", "full")
+
+# Directory with the CSV files, e.g. data/synthetic-sf100 written by `create-data.py --sf 100`
+data_dir = os.environ.get("DATA_DIR", "data")
+
+# The API empties its customer profile cache on a notification on this channel
+profile_cache_channel = "customer_profiles"
+
 csv_files = [
     {
-        "file_path": "data/PostalCode.csv",
+        "file_path": os.path.join(data_dir, "PostalCode.csv"),
         "table_name": "postalcode",
         "primary_key_columns": ["Zip"]
     },
     
     {
-        "file_path": "data/Prospect.csv",
+        "file_path": os.path.join(data_dir, "Prospect.csv"),
         "table_name": "prospect",
         "primary_key_columns": ["ProspectID"]
     },
 
     {
-        "file_path": "data/Customer.csv",
+        "file_path": os.path.join(data_dir, "Customer.csv"),
         "table_name": "customer",
         "primary_key_columns": ["CustomerSSN"]
     },  
 
     {
-        "file_path": "data/ParticipantClaimant.csv",
+        "file_path": os.path.join(data_dir, "ParticipantClaimant.csv"),
         "table_name": "participantclaimant",
         "primary_key_columns": ["ParticipantSSN"]
     },      
 
 
     {
-        "file_path": "data/Policy.csv",
+        "file_path": os.path.join(data_dir, "Policy.csv"),
         "table_name": "policy",
         "primary_key_columns": ["PolicyID"]
     },    
     
 
     {
-        "file_path": "data/Contract.csv",
+        "file_path": os.path.join(data_dir, "Contract.csv"),
         "table_name": "contract",
         "primary_key_columns": ["ContractNumber"]
     },  
 
     {
-        "file_path": "data/CoveredConditions.csv",
+        "file_path": os.path.join(data_dir, "CoveredConditions.csv"),
         "table_name": "coveredconditions",
         "primary_key_columns": ["PolicyID", "CoveredCondition"]
     },      
 
 
     {
-        "file_path": "data/InNetworkProviders.csv",
+        "file_path": os.path.join(data_dir, "InNetworkProviders.csv"),
         "table_name": "innetworkproviders",
-        "primary_key_columns": ["PolicyID"]
+        "primary_key_columns": ["PolicyID", "InNetworkProvider"]
     },      
 
 
     {
-        "file_path": "data/CoveredBy.csv",
+        "file_path": os.path.join(data_dir, "CoveredBy.csv"),
         "table_name": "coveredby",
         "primary_key_columns": ["ParticipantSSN", "ContractNumber"]
     },     
 
     {
-        "file_path": "data/Claim.csv",
+        "file_path": os.path.join(data_dir, "Claim.csv"),
         "table_name": "claim",
         "primary_key_columns": ["ClaimNumber", "DateOfClaim"]
     },    
 
 
     {
-        "file_path": "data/Account.csv",
+        "file_path": os.path.join(data_dir, "Account.csv"),
         "table_name": "account",
         "primary_key_columns": ["AcctNumber", "AccountEstablishedDate"]
     },  
 
 
     {
-        "file_path": "data/Operation.csv",
+        "file_path": os.path.join(data_dir, "Operation.csv"),
         "table_name": "operation",
         "primary_key_columns": ["GeoCode"]
     },  
 
 
     {
-        "file_path": "data/BillingAccount.csv",
+        "file_path": os.path.join(data_dir, "BillingAccount.csv"),
         "table_name": "billingaccount",
         "primary_key_columns": ["BAcctNumber"]
     },    
 
 
     {
-        "file_path": "data/ChronicDiseaseForecast.csv",
+        "file_path": os.path.join(data_dir, "ChronicDiseaseForecast.csv"),
         "table_name": "chronicdiseaseforecast",
         "primary_key_columns": ["State"]
     },       
 
 
     {
-        "file_path": "data/ContractPremium.csv",
+        "file_path": os.path.join(data_dir, "ContractPremium.csv"),
         "table_name": "contractpremium",
         "primary_key_columns": ["PremiumCode", "ContractNumber"]
     },   
 
 
     {
-        "file_path": "data/Invoice.csv",
+        "file_path": os.path.join(data_dir, "Invoice.csv"),
         "table_name": "invoice",
         "primary_key_columns": ["InvoiceNumber", "InvoiceDate"]
     }, 
 
 
     {
-        "file_path": "data/InvoiceDetail.csv",
+        "file_path": os.path.join(data_dir, "InvoiceDetail.csv"),
         "table_name": "invoicedetail",
         "primary_key_columns": ["InvoiceNumber", "LineNumber"]
     },        
 ]
 
-def remove_duplicates(csv_file, pk_columns):
-    unique_rows = OrderedDict()
-    with open(csv_file, 'r') as f:
-        csv_reader = csv.DictReader(f)
-        for row in csv_reader:
-            key = tuple(row[col] for col in pk_columns)
-            unique_rows[key] = row
-    return list(unique_rows.values())
-
-def process_csv_file(cursor, file_info):
+### Dependency Levels
+def dependency_levels(cursor, table_names):
+    # Level 0 tables reference no other loaded table, level n tables only reference
+    # tables of lower levels. Foreign keys are read from the catalog, so the order
+    # follows create-tables.sql instead of a hand-maintained list
+    cursor.execute("""
+        SELECT conrelid::regclass::text, confrelid::regclass::text
+        FROM pg_constraint
+        WHERE contype = 'f'
+    """)
+    references = {table_name: set() for table_name in table_names}
+    for table_name, referenced in cursor.fetchall():
+        if table_name in references and referenced in references and referenced != table_name:
+            references[table_name].add(referenced)
+
+    levels = {}
+    while len(levels) < len(references):
+        ready = [table_name for table_name, referenced in references.items()
+                 if table_name not in levels and referenced.issubset(levels)]
+        if not ready:
+            raise ValueError(f"Circular foreign keys between {sorted(set(references) - set(levels))}")
+        for table_name in ready:
+            levels[table_name] = max((levels[referenced] + 1 for referenced in references[table_name]), default=0)
+    return levels
+
+### COPY Streaming
+class RowStream(io.RawIOBase):
+    # File-like view of the deduplicated rows as CSV, read by copy_expert one
+    # buffer at a time so the rows are never rendered into one big string
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, lineterminator="\n")
+        self.pending = b""
+        self.row_count = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while len(self.pending) < len(b):
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.writer.writerow(row)
+            self.row_count += 1
+            if self.buffer.tell() >= 64 * 1024:
+                self.flush_buffer()
+        if len(self.pending) < len(b):
+            self.flush_buffer()
+        size = min(len(b), len(self.pending))
+        b[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def flush_buffer(self):
+        self.pending += self.buffer.getvalue().encode()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+def staging_table(table_name):
+    return f"_stage_{table_name}"
+
+def column_list(headers):
+    # Headers are folded to lower case, like the unquoted names in create-tables.sql
+    return sql.SQL(', ').join(sql.Identifier(header.lower()) for header in headers)
+
+def stage_csv_file(pool, file_info):
+    # Deduplicates one file and COPYs it into an unlogged staging table. Staging
+    # tables have no keys, so every file can be staged in parallel and committed
+    # on its own; nothing is visible in the real tables until publish_tables
     csv_file_path = file_info["file_path"]
     table_name = file_info["table_name"]
     primary_key_columns = file_info["primary_key_columns"]
 
     print(f"Processing file: {csv_file_path}")
 
-    unique_data = remove_duplicates(csv_file_path, primary_key_columns)
-
-    if not unique_data:
+    # Rows are streamed from the deduplication stage, which spills to disk for large files
+    headers, unique_rows = deduplicated_rows(csv_file_path, primary_key_columns)
+    if not headers:
         print(f"No data to insert after removing duplicates for {csv_file_path}")
-        return
-
-    headers = list(unique_data[0].keys())
-
-    insert_query = f"INSERT INTO {table_name} ({', '.join(headers)}) VALUES ({', '.join(['%s' for _ in headers])})"
-
-    for row in unique_data:
-        # Replace empty strings with None (which will be converted to NULL in SQL)
-        values = [None if row[header] == '' else row[header] for header in headers]
-        cursor.execute(insert_query, values)
-
-    print(f"Inserted {len(unique_data)} unique rows into {table_name}")
-    print()
-
-conn = psycopg2.connect(**db_params)
-cursor = conn.cursor()
-
-try:
-    for file_info in csv_files:
+        return None
+    rows = RowStream(unique_rows)
+    stage = sql.Identifier(staging_table(table_name))
+
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(stage))
+            cursor.execute(sql.SQL("CREATE UNLOGGED TABLE {} (LIKE {})").format(stage, sql.Identifier(table_name)))
+            # Empty fields become NULL, quoted or not, as the row-by-row INSERT did
+            copy_query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv, FORCE_NULL ({}))").format(
+                stage, column_list(headers), column_list(headers))
+            cursor.copy_expert(copy_query.as_string(conn), rows)
+            if not rows.row_count:
+                print(f"No data to insert after removing duplicates for {csv_file_path}")
+                cursor.execute(sql.SQL("DROP TABLE {}").format(stage))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+    if not rows.row_count:
+        return None
+    print(f"Staged {rows.row_count} unique rows for {table_name}")
+    return headers, rows.row_count
+
+def publish_tables(cursor, staged, levels):
+    # Moves every staged table into its target in one transaction, parents before
+    # children, so either all files are loaded or none are
+    for level in sorted(set(levels[table_name] for table_name in staged)):
+        for table_name in [table_name for table_name in staged if levels[table_name] == level]:
+            headers, _ = staged[table_name]
+            cursor.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {}").format(
+                sql.Identifier(table_name), column_list(headers), column_list(headers),
+                sql.Identifier(staging_table(table_name))))
+            print(f"Inserted {cursor.rowcount} unique rows into {table_name} (level {level})")
+
+def merge_query(table_name, headers, primary_key_columns):
+    # Rows whose key is new are inserted; rows whose key exists are only updated
+    # when the md5 of their content differs, so unchanged rows are not rewritten.
+    # xmax is 0 for freshly inserted rows, which tells the two apart
+    target = sql.Identifier(table_name)
+    keys = [column.lower() for column in primary_key_columns]
+    values = [header.lower() for header in headers if header.lower() not in keys]
+    if values:
+        content = sql.SQL(', ').join(sql.Identifier(value) for value in values)
+        excluded = sql.SQL(', ').join(sql.SQL("EXCLUDED.{}").format(sql.Identifier(value)) for value in values)
+        current = sql.SQL(', ').join(sql.SQL("{}.{}").format(target, sql.Identifier(value)) for value in values)
+        conflict_action = sql.SQL("DO UPDATE SET ({}) = ROW({}) WHERE md5(ROW({})::text) IS DISTINCT FROM md5(ROW({})::text)").format(
+            content, excluded, current, excluded)
+    else:
+        # Tables made only of key columns have nothing to update
+        conflict_action = sql.SQL("DO NOTHING")
+
+    return sql.SQL("""
+        WITH merged AS (
+            INSERT INTO {target} ({columns}) SELECT {columns} FROM {stage}
+            ON CONFLICT ({keys}) {conflict_action}
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged
+    """).format(target=target,
+                columns=column_list(headers),
+                stage=sql.Identifier(staging_table(table_name)),
+                keys=column_list(primary_key_columns),
+                conflict_action=conflict_action)
+
+def merge_tables(cursor, staged, levels, files):
+    # Delta counterpart of publish_tables, in the same single transaction
+    primary_keys = {file_info["table_name"]: file_info["primary_key_columns"] for file_info in files}
+    for level in sorted(set(levels[table_name] for table_name in staged)):
+        for table_name in [table_name for table_name in staged if levels[table_name] == level]:
+            headers, row_count = staged[table_name]
+            cursor.execute(merge_query(table_name, headers, primary_keys[table_name]))
+            inserted, updated = cursor.fetchone()
+            print(f"Merged {table_name} (level {level}): {inserted} inserted, {updated} updated, "
+                  f"{row_count - inserted - updated} unchanged")
+
+def drop_staging_tables(cursor, table_names):
+    for table_name in table_names:
+        cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(staging_table(table_name))))
+
+def load_tables(files=None, workers=None, mode=None):
+    files = csv_files if files is None else files
+    workers = load_workers if workers is None else workers
+    mode = mode or load_mode
+    if mode not in ("full", "delta"):
+        raise ValueError(f"Unknown load mode: {mode}")
+
+    present = []
+    for file_info in files:
         if not os.path.exists(file_info["file_path"]):
             print(f"File not found: {file_info['file_path']}")
             continue
-        
-        process_csv_file(cursor, file_info)
-
-    conn.commit()
-    print("All files processed successfully!")
-
-except Exception as e:
-    conn.rollback()
-    print(f"An error occurred: {e}")
-
-finally:
-    cursor.close()
-    conn.close()
-
-
-    
-
-
+        present.append(file_info)
+
+    # One connection per staging thread plus the one that publishes: the pool raises
+    # instead of waiting when a thread asks for more than maxconn
+    workers = max(1, workers)
+    pool = ThreadedConnectionPool(1, workers + 1, **db_params)
+    conn = pool.getconn()
+    cursor = conn.cursor()
+    staged = {}
+
+    try:
+        levels = dependency_levels(cursor, [file_info["table_name"] for file_info in files])
+        conn.commit()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {file_info["table_name"]: executor.submit(stage_csv_file, pool, file_info)
+                       for file_info in present}
+            for table_name, future in futures.items():
+                result = future.result()
+                if result is not None:
+                    staged[table_name] = result
+        print()
+
+        if mode == "delta":
+            merge_tables(cursor, staged, levels, present)
+        else:
+            publish_tables(cursor, staged, levels)
+        # Delivered on commit, together with the new rows
+        cursor.execute(sql.SQL("NOTIFY {}").format(sql.Identifier(profile_cache_channel)))
+        conn.commit()
+        print("All files processed successfully!")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"An error occurred: {e}")
+        # The caller (and the exit status of the script) must see that nothing was loaded
+        raise
+
+    finally:
+        try:
+            drop_staging_tables(cursor, [file_info["table_name"] for file_info in present])
+            conn.commit()
+        finally:
+            cursor.close()
+            pool.putconn(conn)
+            pool.closeall()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the CSV files in data/ into PostgreSQL")
+    parser.add_argument("--mode", choices=["full", "delta"], default=load_mode,
+                        help="full loads empty tables, delta merges changed rows (default: LOAD_MODE or full)")
+    parser.add_argument("--workers", type=int, default=load_workers)
+    args = parser.parse_args()
+    load_tables(workers=args.workers, mode=args.mode)
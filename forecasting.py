@@ -0,0 +1,224 @@
+### Libraries
+import os
+import time
+import hashlib
+import warnings
+import contextlib
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from utils import load_json, save_json
+
+# Number of processes used for the per-series model fits
+forecast_workers = int(os.environ.get("FORECAST_WORKERS", os.cpu_count() or 1))
+
+# Fitted parameters and forecasts per (metric, series), reused across runs
+model_store_path = os.environ.get("FORECAST_MODEL_STORE", ".cache/forecast-models.json")
+
+# "arima" fits one statsmodels model per series, "fast" forecasts every series
+# at once with a closed-form AR(1) on the yearly differences
+forecast_method = os.environ.get("FORECAST_METHOD", "arima")
+
+# Written by backtest.py: the best ARIMA order per metric and state
+order_selection_path = "data/ForecastOrderSelection.csv"
+
+### Per-Series Model Fitting
+def init_worker():
+    # Pool children only: the settings last for the life of the process
+    warnings.filterwarnings('ignore')
+    # One BLAS thread per process, otherwise the workers oversubscribe the cores
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    except ImportError:
+        pass
+
+@contextlib.contextmanager
+def serial_fitting():
+    # The same settings as init_worker for fits in the calling process, undone on exit
+    with warnings.catch_warnings(), contextlib.ExitStack() as stack:
+        warnings.filterwarnings('ignore')
+        try:
+            from threadpoolctl import threadpool_limits
+            stack.enter_context(threadpool_limits(1))
+        except ImportError:
+            pass
+        yield
+
+def fit_arima(key, values, name, order=(1, 1, 1), start_params=None, verbose=True):
+    # Returns the one-step forecast and the fitted parameters (None when no model was fitted)
+    from statsmodels.tsa.arima.model import ARIMA
+
+    if len(values) < 2:
+        return np.nan, None
+    try:
+        model = ARIMA(values, order=order)
+        results = model.fit(start_params=start_params)
+        forecast = results.forecast(steps=1)
+        return forecast[0], [float(param) for param in results.params]
+    except Exception as e:
+        if verbose:
+            print(f"Error forecasting for state: {key} in {name}. Error: {str(e)}")
+        return np.nan, None
+
+### Model Store
+def load_model_store(path=None):
+    return load_json(path or model_store_path, {})
+
+def save_model_store(store, path=None):
+    save_json(store, path or model_store_path)
+
+def store_key(key):
+    return key if isinstance(key, str) else "|".join(map(str, key))
+
+def series_hash(values, order):
+    hasher = hashlib.sha256(np.asarray(values, dtype=np.float64).tobytes())
+    hasher.update(repr(tuple(order)).encode())
+    return hasher.hexdigest()
+
+def load_selected_orders(name, path=None):
+    path = path or order_selection_path
+    if not os.path.exists(path):
+        return {}
+    selection = pd.read_csv(path)
+    selection = selection[selection['Metric'] == name]
+    return {state: tuple(int(part) for part in order.split(','))
+            for state, order in zip(selection['State'], selection['Order'])}
+
+def forecast_series(series, name, workers=None, order=(1, 1, 1), store=None, orders=None):
+    # series maps a key (a state today, or a county/stratification tuple) to its
+    # values in year order; results come back in the same key order. With a
+    # store, unchanged series reuse their stored forecast and changed ones are
+    # warm-started from their previous parameters. orders overrides order per key
+    workers = forecast_workers if workers is None else workers
+    store = {} if store is None else store
+    orders = {key: (orders or {}).get(key, order) for key in series}
+    hashes = {key: series_hash(values, orders[key]) for key, values in series.items()}
+
+    forecasts = {}
+    pending = []
+    for key in series:
+        entry = store.get(store_key(key))
+        if entry and entry["series_hash"] == hashes[key]:
+            forecasts[key] = np.nan if entry["forecast"] is None else entry["forecast"]
+        else:
+            warm_start = entry["params"] if entry and entry["order"] == list(orders[key]) else None
+            pending.append((key, warm_start))
+
+    keys = [key for key, _ in pending]
+    values = [series[key] for key in keys]
+    start_params = [params for _, params in pending]
+    key_orders = [orders[key] for key in keys]
+    if workers <= 1 or len(keys) <= 1:
+        with serial_fitting():
+            results = [fit_arima(key, value, name, key_order, params)
+                       for key, value, key_order, params in zip(keys, values, key_orders, start_params)]
+    else:
+        chunksize = max(1, len(keys) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            results = list(executor.map(fit_arima, keys, values, [name] * len(keys), key_orders,
+                                        start_params, chunksize=chunksize))
+
+    for key, (forecast, params) in zip(keys, results):
+        forecasts[key] = forecast
+        store[store_key(key)] = {"series_hash": hashes[key],
+                                 "order": list(orders[key]),
+                                 "params": params,
+                                 "forecast": None if pd.isna(forecast) else float(forecast)}
+    if series:
+        print(f"{name}: fitted {len(keys)} of {len(series)} series, reused {len(series) - len(keys)}")
+    return {key: forecasts[key] for key in series}
+
+### Batched Forecasting
+def pad_series(series):
+    # Histories are right-aligned so that the last column is every series' latest year
+    keys = list(series)
+    width = max((len(values) for values in series.values()), default=0)
+    matrix = np.full((len(keys), width), np.nan)
+    for row, key in enumerate(keys):
+        values = np.asarray(series[key], dtype=np.float64)
+        if len(values):
+            matrix[row, width - len(values):] = values
+    return keys, matrix
+
+def fast_forecast_series(series, max_phi=0.99):
+    # y[t+1] = y[t] + mu + phi * (d[t] - mu), with mu and phi estimated per row
+    # from the first differences d by least squares, all rows at once
+    keys, y = pad_series(series)
+    if not keys:
+        return {}
+    d = np.diff(y, axis=1)
+    valid = ~np.isnan(d)
+    n_diffs = valid.sum(axis=1)
+    mu = np.divide(np.where(valid, d, 0).sum(axis=1), n_diffs,
+                   out=np.zeros(len(keys)), where=n_diffs > 0)
+
+    centered = d - mu[:, None]
+    lagged, current = centered[:, :-1], centered[:, 1:]
+    pairs = ~np.isnan(lagged) & ~np.isnan(current)
+    numerator = np.where(pairs, lagged * current, 0).sum(axis=1)
+    denominator = np.where(pairs, lagged * lagged, 0).sum(axis=1)
+    phi = np.divide(numerator, denominator, out=np.zeros(len(keys)), where=denominator > 0)
+    phi = np.clip(phi, -max_phi, max_phi)
+
+    last_diff = np.where(n_diffs > 0, d[:, -1] if d.shape[1] else 0, 0)
+    forecasts = y[:, -1] + mu + phi * (last_diff - mu)
+    forecasts[n_diffs < 1] = np.nan
+    return dict(zip(keys, forecasts))
+
+def forecast_comparison(df, name, workers=None, model_store=None, orders=None):
+    # Per-state ARIMA vs fast forecasts with their relative difference and timings
+    count_column = '{}Count'.format(name)
+    series = {state: state_data[count_column].to_numpy(dtype=float)
+              for state, state_data in df.sort_values(['State', 'Year']).groupby('State', sort=False)}
+
+    started = time.perf_counter()
+    arima = forecast_series(series, name, workers,
+                            store=None if model_store is None else model_store.setdefault(name, {}),
+                            orders=orders)
+    arima_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    fast = fast_forecast_series(series)
+    fast_seconds = time.perf_counter() - started
+
+    report = pd.DataFrame({'State': list(series),
+                           'ARIMAForecast': [arima[key] for key in series],
+                           'FastForecast': [fast[key] for key in series]})
+    report['AbsoluteDifference'] = (report['FastForecast'] - report['ARIMAForecast']).abs()
+    report['RelativeDifference'] = report['AbsoluteDifference'] / report['ARIMAForecast'].abs()
+    report = report.sort_values('State').reset_index(drop=True)
+
+    print(f"{name}: ARIMA {arima_seconds:.2f}s, fast {fast_seconds:.4f}s, "
+          f"mean relative difference {report['RelativeDifference'].mean():.2%}, "
+          f"max {report['RelativeDifference'].max():.2%}")
+    return report
+
+### Time Series Forecasting
+def process_dataframe(df, name, workers=None, model_store=None, method=None, orders=None):
+    # Charts are rendered separately by plotting.py, off the forecasting path
+    count_column = '{}Count'.format(name)
+
+    df = df.assign(Year=pd.to_datetime(df['Year'].astype(str) + '-01-01'))
+    last_year = df['Year'].dt.year.max()
+
+    # Group once instead of scanning the whole frame for every state
+    state_groups = {state: state_data for state, state_data in df.sort_values(['State', 'Year']).groupby('State', sort=False)}
+    series = {state: state_data[count_column].to_numpy(dtype=float) for state, state_data in state_groups.items()}
+    if (method or forecast_method) == "fast":
+        forecasts = fast_forecast_series(series)
+    else:
+        forecasts = forecast_series(series, name, workers,
+                                    store=None if model_store is None else model_store.setdefault(name, {}),
+                                    orders=orders)
+    last_year_data = {state: state_data[state_data['Year'].dt.year == last_year][count_column].values[0]
+                      for state, state_data in state_groups.items()}
+
+    forecast_df = pd.DataFrame({
+        'State': list(forecasts.keys()),
+        f'{name}CountCurrentYear': list(last_year_data.values()),
+        f'{name}CountNextYear': list(forecasts.values())
+    })
+    forecast_df = forecast_df.sort_values('State').reset_index(drop=True)
+    forecast_df[f'{name}CountNextYear'] = forecast_df[f'{name}CountNextYear'].apply(lambda x: int(x) if pd.notna(x) else x)
+
+    return forecast_df
@@ -0,0 +1,155 @@
+### Libraries
+import os
+import sys
+import json
+import hashlib
+import argparse
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from utils import load_json, save_json
+
+# Bump plotting_version whenever the chart layout changes, so every chart is re-rendered
+plotting_version = 1
+
+# Input hash of every rendered chart; a chart is only re-rendered when its hash changes
+plot_manifest_path = os.environ.get("PLOT_MANIFEST", ".cache/plot-manifest.json")
+plot_workers = int(os.environ.get("PLOT_WORKERS", os.cpu_count() or 1))
+
+# Below this many charts a process pool costs more than it saves
+min_parallel_charts = 8
+
+forecast_csv_path = "data/ChronicDiseaseForecast.csv"
+metric_names = ["Mortality", "Hospitalization"]
+
+### Manifest
+def load_plot_manifest(path=None):
+    return load_json(path or plot_manifest_path, {})
+
+def save_plot_manifest(manifest, path=None):
+    save_json(manifest, path or plot_manifest_path)
+
+def chart_path(name, state):
+    return os.path.join(f"{name.lower()}-forecast", f"{state}_forecast.png")
+
+def chart_hash(chart):
+    return hashlib.sha256(json.dumps([plotting_version, chart], sort_keys=True).encode()).hexdigest()
+
+### Chart Inputs
+def state_charts(stats, forecast_df, name, states=None):
+    # One JSON-serializable input per state: its history, the last year of the
+    # whole frame and that state's forecast, looked up once instead of per chart
+    count_column = f"{name}Count"
+    years = stats["Year"]
+    years = years.dt.year if pd.api.types.is_datetime64_any_dtype(years) else years.astype(int)
+    stats = stats.assign(Year=years)
+    last_year = int(stats["Year"].max())
+    forecasts = forecast_df.set_index("State")[f"{name}CountNextYear"]
+
+    charts = {}
+    for state, state_data in stats.sort_values(["State", "Year"]).groupby("State", sort=False):
+        if states is not None and state not in states:
+            continue
+        last_year_values = state_data.loc[state_data["Year"] == last_year, count_column]
+        forecast_value = forecasts.get(state)
+        charts[state] = {"name": name,
+                         "state": state,
+                         "years": [int(year) for year in state_data["Year"]],
+                         "counts": [int(count) for count in state_data[count_column]],
+                         "last_year": last_year,
+                         "last_year_value": int(last_year_values.iloc[0]) if len(last_year_values) else None,
+                         "forecast_value": None if pd.isna(forecast_value) else int(forecast_value)}
+    return charts
+
+### Rendering
+def init_plot_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+
+def plot_state_forecast(chart, path):
+    import matplotlib.pyplot as plt
+
+    name, state, last_year = chart["name"], chart["state"], chart["last_year"]
+    years = pd.to_datetime([f"{year}-01-01" for year in chart["years"]])
+    plt.figure(figsize=(10, 6))
+    plt.plot(years, chart["counts"], label='Historical Data')
+    plt.scatter(years, chart["counts"], color='blue')
+
+    last_year_value = chart["last_year_value"]
+    forecast_value = chart["forecast_value"]
+
+    if forecast_value is not None:
+        plt.scatter(pd.to_datetime(f"{last_year}-01-01"), last_year_value, color='blue', s=100, zorder=5)
+        plt.scatter(pd.to_datetime(f"{last_year + 1}-01-01"), forecast_value, color='red', s=100, zorder=5)
+        plt.plot([pd.to_datetime(f"{last_year}-01-01"), pd.to_datetime(f"{last_year + 1}-01-01")],
+                 [last_year_value, forecast_value],
+                 color='red', linestyle='--', label='Forecast')
+
+    plt.title(f'{name} Data and Forecast for {state}')
+    plt.xlabel('Year')
+    plt.ylabel(f'{name} Number')
+    plt.legend()
+    plt.grid(True, linestyle='--', alpha=0.7)
+    plt.tight_layout()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    plt.savefig(path)
+    plt.close()
+
+def render_chart(task):
+    chart, path = task
+    plot_state_forecast(chart, path)
+    return path
+
+def render_forecast_plots(stats, forecast_df, name, states=None, workers=None, force=False, manifest=None):
+    # Renders the charts whose inputs changed since they were last rendered (or
+    # whose file is missing) and returns the paths that were written
+    workers = plot_workers if workers is None else workers
+    manifest = load_plot_manifest() if manifest is None else manifest
+
+    tasks = []
+    hashes = {}
+    for state, chart in state_charts(stats, forecast_df, name, states).items():
+        path = chart_path(name, state)
+        hashes[path] = chart_hash(chart)
+        if force or manifest.get(path) != hashes[path] or not os.path.exists(path):
+            tasks.append((chart, path))
+
+    if workers <= 1 or len(tasks) < min_parallel_charts:
+        init_plot_worker()
+        rendered = [render_chart(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_plot_worker) as executor:
+            rendered = list(executor.map(render_chart, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+
+    for path in rendered:
+        manifest[path] = hashes[path]
+    print(f"{name}: rendered {len(rendered)} of {len(hashes)} charts")
+    return rendered
+
+def render_all_plots(stats_frames, forecast_df, states=None, workers=None, force=False):
+    manifest = load_plot_manifest()
+    rendered = []
+    for name, stats in stats_frames.items():
+        rendered += render_forecast_plots(stats, forecast_df, name, states, workers, force, manifest)
+    save_plot_manifest(manifest)
+    return rendered
+
+
+if __name__ == "__main__":
+    # Renders the charts from the cleaned data and the forecast CSV written by
+    # chronic-disease-prediction.py, e.g. `python plotting.py --state Utah`
+    parser = argparse.ArgumentParser(description="Render the per-state forecast charts")
+    parser.add_argument("--state", action="append", help="render only this state (repeatable)")
+    parser.add_argument("--metric", choices=metric_names, action="append", help="render only this metric")
+    parser.add_argument("--force", action="store_true", help="re-render even if the inputs are unchanged")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    from datalake import get_data_lake
+    from cleaning import load_cleaned_frames
+
+    if not os.path.exists(forecast_csv_path):
+        sys.exit(f"{forecast_csv_path} not found, run chronic-disease-prediction.py first")
+    frames = load_cleaned_frames(get_data_lake())
+    stats_frames = {name: frames[f"{name.lower()}_number_stats"] for name in args.metric or metric_names}
+    render_all_plots(stats_frames, pd.read_csv(forecast_csv_path), states=args.state,
+                     workers=args.workers, force=args.force)
@@ -0,0 +1,193 @@
+import psycopg2
+import os
+import sys
+import csv
+import io
+import time
+import argparse
+from psycopg2 import sql
+
+# Database connection parameters, overridable with the standard libpq variables
+db_params = {
+    "host": os.environ.get("PGHOST", "localhost"),
+    "database": os.environ.get("PGDATABASE", "postgres"),
+    "user": os.environ.get("PGUSER", "postgres"),
+    "password": os.environ.get("PGPASSWORD", "secret_password")
+}
+# CSV file path
+csv_file_path = 'data/ChronicDiseaseForecast.csv'
+
+forecast_table = 'chronicdiseaseforecast'
+staging_table = 'chronicdiseaseforecast_stage'
+
+# LastInvoiceDetailsPerCustomer is a trigger-maintained table and needs no refresh
+materialized_views = ['customercontract']
+
+# The API empties its customer profile cache on a notification on this channel
+profile_cache_channel = 'customer_profiles'
+
+def get_column_names(cursor, table_name):
+    cursor.execute(sql.SQL("SELECT * FROM {} LIMIT 0").format(sql.Identifier(table_name)))
+    return [desc[0] for desc in cursor.description]
+
+def read_forecast_csv(path, columns):
+    # Returns the header in table column names and the rows with the right number of fields
+    with open(path, 'r') as f:
+        csv_reader = csv.reader(f)
+        header = [column.lower() for column in next(csv_reader)]
+        if sorted(header) != sorted(columns):
+            raise ValueError(f"{path} has columns {header}, expected {columns}")
+
+        rows = []
+        for row in csv_reader:
+            # Ensure the row has the correct number of elements
+            if len(row) != len(header):
+                print(f"Skipping row {csv_reader.line_num}: incorrect number of fields")
+                continue
+            rows.append([None if value == '' else value for value in row])
+    if not rows:
+        raise ValueError(f"{path} has no forecast rows")
+    return header, rows
+
+def copy_rows(cur, header, rows):
+    # One COPY for the whole file; the rows go through csv again so that the
+    # skipped ones above are not part of it
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    buffer.seek(0)
+    copy_query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+        sql.Identifier(staging_table), sql.SQL(', ').join(map(sql.Identifier, header)))
+    cur.copy_expert(copy_query.as_string(cur.connection), buffer)
+    return len(rows)
+
+def insert_rows(cur, header, rows):
+    # Fallback when COPY rejects the file: row by row, each in its own savepoint,
+    # so a bad row is skipped without aborting the transaction
+    insert_query = sql.SQL("INSERT INTO {} ({}) VALUES ({})").format(
+        sql.Identifier(staging_table),
+        sql.SQL(', ').join(map(sql.Identifier, header)),
+        sql.SQL(', ').join(sql.Placeholder() * len(header))
+    )
+    inserted = 0
+    for line_num, row in enumerate(rows, start=2):
+        cur.execute("SAVEPOINT forecast_row")
+        try:
+            cur.execute(insert_query, row)
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT forecast_row")
+            print(f"Error inserting row {line_num}: {e}")
+        else:
+            inserted += 1
+        cur.execute("RELEASE SAVEPOINT forecast_row")
+    return inserted
+
+def stage_forecasts(cur, header, rows):
+    cur.execute(sql.SQL("CREATE TEMPORARY TABLE {} (LIKE {} INCLUDING ALL) ON COMMIT DROP").format(
+        sql.Identifier(staging_table), sql.Identifier(forecast_table)))
+    cur.execute("SAVEPOINT forecast_copy")
+    try:
+        expected = copy_rows(cur, header, rows)
+    except psycopg2.Error as e:
+        cur.execute("ROLLBACK TO SAVEPOINT forecast_copy")
+        print(f"COPY failed, inserting row by row: {e}")
+        expected = insert_rows(cur, header, rows)
+
+    cur.execute(sql.SQL("SELECT count(*) FROM {}").format(sql.Identifier(staging_table)))
+    staged = cur.fetchone()[0]
+    if staged != expected or staged == 0:
+        raise ValueError(f"Staged {staged} forecast rows, expected {expected}")
+    return staged
+
+def swap_forecasts(cur):
+    # DELETE + INSERT instead of TRUNCATE: readers keep seeing the previous rows
+    # until commit rather than waiting on an exclusive lock. The table cannot be
+    # swapped by renaming because CustomerContract depends on it
+    cur.execute(sql.SQL("DELETE FROM {}").format(sql.Identifier(forecast_table)))
+    cur.execute(sql.SQL("INSERT INTO {} SELECT * FROM {}").format(
+        sql.Identifier(forecast_table), sql.Identifier(staging_table)))
+    return cur.rowcount
+
+def reload_forecasts(conn, path=csv_file_path):
+    with conn.cursor() as cur:
+        columns = get_column_names(cur, forecast_table)
+        header, rows = read_forecast_csv(path, columns)
+        staged = stage_forecasts(cur, header, rows)
+        swapped = swap_forecasts(cur)
+    conn.commit()
+    print(f"Reloaded {swapped} of {staged} staged rows into ChronicDiseaseForecast")
+
+def refresh_materialized_view(conn, view_name):
+    # CONCURRENTLY lets the API keep reading the old contents during the refresh.
+    # It needs a populated view with a unique index, so the first build (or a
+    # view without its index) falls back to a plain refresh
+    with conn.cursor() as cur:
+        cur.execute("SELECT ispopulated FROM pg_matviews WHERE matviewname = %s", (view_name,))
+        populated = cur.fetchone()
+        if populated is None:
+            raise ValueError(f"Materialized view {view_name} does not exist")
+
+        started = time.perf_counter()
+        concurrently = populated[0]
+        if concurrently:
+            try:
+                cur.execute(sql.SQL("REFRESH MATERIALIZED VIEW CONCURRENTLY {}").format(sql.Identifier(view_name)))
+            except psycopg2.Error as e:
+                conn.rollback()
+                concurrently = False
+                print(f"Refreshing {view_name} without CONCURRENTLY: {str(e).strip()}")
+        if not concurrently:
+            cur.execute(sql.SQL("REFRESH MATERIALIZED VIEW {}").format(sql.Identifier(view_name)))
+    conn.commit()
+    elapsed = time.perf_counter() - started
+    print(f"Refreshed {view_name}{' concurrently' if concurrently else ''} in {elapsed:.2f}s")
+    return elapsed
+
+def refresh_materialized_views(conn):
+    # Runs after the forecast swap has committed, so the swap does not wait on the refreshes.
+    # Each view is committed on its own to keep its locks short
+    return {view_name: refresh_materialized_view(conn, view_name) for view_name in materialized_views}
+
+def notify_profile_cache(conn):
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("NOTIFY {}").format(sql.Identifier(profile_cache_channel)))
+    conn.commit()
+
+
+if __name__ == "__main__":
+    # Run by database-pipeline.py once chronic-disease-prediction.py has written
+    # data/ChronicDiseaseForecast.csv, or on its own to reload that file. The pipeline
+    # runs the two halves as separate stages so that the refresh happens on every run
+    parser = argparse.ArgumentParser(description="Reload the forecasts and refresh the materialized views")
+    steps = parser.add_mutually_exclusive_group()
+    steps.add_argument("--reload-only", action="store_true",
+                       help="swap in data/ChronicDiseaseForecast.csv without refreshing the views")
+    steps.add_argument("--refresh-only", action="store_true",
+                       help="refresh the views and notify the API without reloading the forecasts")
+    args = parser.parse_args()
+
+    conn = None
+    try:
+        # Connect to the database
+        conn = psycopg2.connect(**db_params)
+
+        # 1. and 2. Stage the CSV and swap it into ChronicDiseaseForecast in one transaction
+        if not args.refresh_only:
+            reload_forecasts(conn)
+
+        if not args.reload_only:
+            refresh_materialized_views(conn)
+            notify_profile_cache(conn)
+
+        print("All operations completed successfully.")
+
+    except (Exception, psycopg2.Error) as error:
+        if conn:
+            conn.rollback()
+        print("Error while connecting to PostgreSQL or executing operations:", error)
+        # The pipeline sees the failure in the exit status
+        sys.exit(1)
+
+    finally:
+        if conn:
+            conn.close()
+            print("PostgreSQL connection is closed")
@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from datalake import LocalDataLake, write_partitioned_dataset, upload_dataset
+from cleaning import load_cdi_data, clean_cdi_data
+
+### Reference Implementation
+# The cleaning that cleaning.py replaced, kept as the definition of the expected output.
+# It reads the whole CSV and does all of the filtering in pandas, so the column, partition
+# and row filters pushed down to the Parquet reader are checked as well
+def reference_load_cdi_data(csv_path):
+    return pd.read_csv(csv_path)
+
+def reference_clean_cdi_data(data):
+    data = (data[data['datavalue'].isna()==False]).reset_index(drop = True)
+    data = data[data["yearstart"] != 2001]
+
+    mortality = data[data["question"].apply(lambda x: "mortality" in x.lower())]
+    hospitalization = data[data["question"].apply(lambda x: "hospital" in x.lower())]
+
+    columns = ["yearend", "locationdesc", "topic", "question", "stratificationcategory1", "stratification1", "datavalue"]
+    hospitalization_number = hospitalization.query("datavaluetype == 'Number' and topic != 'Older Adults'")
+    hospitalization_number = hospitalization_number[(hospitalization_number['question']).apply(lambda x: "rate" not in x)]
+    hospitalization_number = hospitalization_number[columns]
+    hospitalization_number["datavalue"] = hospitalization_number["datavalue"].apply(int)
+
+    mortality_number = mortality.query("datavaluetype == 'Number'")
+    mortality_number = mortality_number[(mortality_number['question']).apply(lambda x: "rate" not in x)]
+    mortality_number = mortality_number[columns]
+    mortality_number["datavalue"] = mortality_number["datavalue"].apply(int)
+
+    renames = {"yearend": "Year",
+               "locationdesc": "State",
+               "topic": "ChronicDiseaseCategory",
+               "question": "ChronicDiseaseExplanation",
+               "stratificationcategory1": "StratificationCategory",
+               "stratification1": "Stratification"}
+    hospitalization_number = hospitalization_number.rename(
+        columns={**renames, "datavalue": "HospitalizationCount"}).reset_index(drop=True)
+    mortality_number = mortality_number.rename(columns={**renames, "datavalue": "MortalityCount"}).reset_index(drop=True)
+
+    hospitalization_number_stats = hospitalization_number[["Year", "State", "HospitalizationCount"]].groupby(["Year", "State"]).sum().reset_index()
+    mortality_number_stats = mortality_number[["Year", "State", "MortalityCount"]].groupby(["Year", "State"]).sum().reset_index()
+
+    return {"hospitalization_number": hospitalization_number,
+            "mortality_number": mortality_number,
+            "hospitalization_number_stats": hospitalization_number_stats,
+            "mortality_number_stats": mortality_number_stats}
+
+### Fixture
+questions = [("Cardiovascular Disease", "Mortality from heart failure"),
+             ("Cardiovascular Disease", "Hospitalization for heart failure among Medicare-eligible persons aged >= 65 years"),
+             ("Diabetes", "Mortality due to diabetes reported as any listed cause of death"),
+             ("Diabetes", "Hospitalization with diabetes as a listed diagnosis"),
+             ("Chronic Kidney Disease", "Mortality with end-stage renal disease, crude rate"),
+             ("Older Adults", "Hospitalization for hip fracture among Medicare-eligible persons aged >= 65 years"),
+             ("Alcohol", "Binge drinking prevalence among adults aged >= 18 years")]
+value_types = ["Number", "Crude Rate", "Age-adjusted Rate"]
+stratifications = [("Overall", "Overall"), ("Gender", "Male"), ("Gender", "Female"), ("Race/Ethnicity", "Hispanic")]
+states = ["Alabama", "Alaska", "Arizona", "District of Columbia", "United States"]
+
+@pytest.fixture
+def cdi_csv(tmp_path):
+    rng = np.random.default_rng(0)
+    rows = 3000
+    question_index = rng.integers(0, len(questions), rows)
+    stratification_index = rng.integers(0, len(stratifications), rows)
+    years = rng.integers(2001, 2022, rows)
+    # Fractional counts exercise the truncation, empty values the missing-value filter
+    values = np.round(rng.lognormal(6, 1.5, rows), 1).astype(str)
+    values[rng.random(rows) < 0.05] = ""
+    frame = pd.DataFrame({"yearstart": years,
+                          "yearend": years + rng.integers(0, 2, rows),
+                          "locationdesc": np.array(states, dtype=object)[rng.integers(0, len(states), rows)],
+                          "topic": [questions[index][0] for index in question_index],
+                          "question": [questions[index][1] for index in question_index],
+                          "datavaluetype": np.array(value_types, dtype=object)[rng.integers(0, len(value_types), rows)],
+                          "stratificationcategory1": [stratifications[index][0] for index in stratification_index],
+                          "stratification1": [stratifications[index][1] for index in stratification_index],
+                          "datavalue": values})
+    csv_path = tmp_path / "cdi.csv"
+    frame.to_csv(csv_path, index=False)
+    return str(csv_path)
+
+@pytest.fixture
+def data_lake(cdi_csv, tmp_path):
+    write_partitioned_dataset(cdi_csv, str(tmp_path / "parquet"))
+    lake = LocalDataLake(str(tmp_path / "lake"))
+    upload_dataset(lake, str(tmp_path / "parquet"))
+    return lake
+
+def sorted_frame(frame):
+    # Row order within the parquet partitions is not part of the contract
+    frame = frame.astype({column: object for column in frame.columns if isinstance(frame[column].dtype, pd.CategoricalDtype)})
+    return frame.sort_values(list(frame.columns)).reset_index(drop=True)
+
+### Tests
+def test_stats_match_reference(cdi_csv, data_lake):
+    expected = reference_clean_cdi_data(reference_load_cdi_data(cdi_csv))
+    frames = clean_cdi_data(load_cdi_data(data_lake))
+    for name in ["hospitalization_number_stats", "mortality_number_stats"]:
+        assert len(expected[name]) > 0
+        assert_frame_equal(frames[name], expected[name], check_dtype=False)
+
+def test_number_frames_match_reference(cdi_csv, data_lake):
+    expected = reference_clean_cdi_data(reference_load_cdi_data(cdi_csv))
+    frames = clean_cdi_data(load_cdi_data(data_lake))
+    for name in ["hospitalization_number", "mortality_number"]:
+        assert len(expected[name]) > 0
+        assert_frame_equal(sorted_frame(frames[name]).astype(object),
+                           sorted_frame(expected[name]).astype(object),
+                           check_dtype=False)
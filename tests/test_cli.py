@@ -0,0 +1,12 @@
+import os
+
+from cli import check_imports
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Every subcommand with a budget imports its script within it and without the heavy libraries.
+# CLI_BUDGET_SCALE loosens the budgets on a slow machine, like `check-imports --budget-scale`
+def test_imports_within_budget(monkeypatch):
+    # The scripts are found relative to the repository root
+    monkeypatch.chdir(repo_dir)
+    assert check_imports(budget_scale=float(os.environ.get("CLI_BUDGET_SCALE", "1.0"))) == []
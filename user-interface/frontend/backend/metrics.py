@@ -0,0 +1,169 @@
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from collections import defaultdict
+import threading
+import time
+
+# Upper bounds in seconds (latencies) and counts (queries per request); +Inf is implicit
+latency_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+query_count_buckets = (0, 1, 2, 4, 8, 16, 32, 64)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, bucket_count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            cumulative += bucket_count
+            yield f'{name}_bucket{format_labels({**labels, "le": str(bound)})} {cumulative}'
+        yield f'{name}_sum{format_labels(labels)} {self.sum}'
+        yield f'{name}_count{format_labels(labels)} {self.count}'
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+class Metrics:
+    # In-process registry, rendered in the Prometheus text format by /metrics.
+    # Everything is keyed by endpoint (the route rule), never by the raw path,
+    # so SSNs do not end up in label values
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.request_latency = defaultdict(lambda: Histogram(latency_buckets))
+        self.request_queries = defaultdict(lambda: Histogram(query_count_buckets))
+        self.request_query_time = defaultdict(lambda: Histogram(latency_buckets))
+        self.queries_total = 0
+        self.query_seconds_total = 0.0
+        self.cache_lookups = defaultdict(int)
+        self.pools = {}
+
+    def observe_request(self, endpoint, method, status, seconds, queries, query_seconds):
+        with self.lock:
+            self.request_latency[(endpoint, method, str(status))].observe(seconds)
+            self.request_queries[endpoint].observe(queries)
+            self.request_query_time[endpoint].observe(query_seconds)
+
+    def observe_query(self, seconds):
+        with self.lock:
+            self.queries_total += 1
+            self.query_seconds_total += seconds
+
+    def record_cache_lookup(self, cache, hit):
+        with self.lock:
+            self.cache_lookups[(cache, 'hit' if hit else 'miss')] += 1
+
+    def register_pool(self, name, pool):
+        self.pools[name] = pool
+
+    def render(self):
+        with self.lock:
+            lines = ['# HELP api_request_duration_seconds Request latency by endpoint, method and status',
+                     '# TYPE api_request_duration_seconds histogram']
+            for (endpoint, method, status), histogram in sorted(self.request_latency.items()):
+                lines += histogram.lines('api_request_duration_seconds',
+                                         {'endpoint': endpoint, 'method': method, 'status': status})
+
+            lines += ['# HELP api_request_db_queries Database queries per request by endpoint',
+                      '# TYPE api_request_db_queries histogram']
+            for endpoint, histogram in sorted(self.request_queries.items()):
+                lines += histogram.lines('api_request_db_queries', {'endpoint': endpoint})
+
+            lines += ['# HELP api_request_db_seconds Database time per request by endpoint',
+                      '# TYPE api_request_db_seconds histogram']
+            for endpoint, histogram in sorted(self.request_query_time.items()):
+                lines += histogram.lines('api_request_db_seconds', {'endpoint': endpoint})
+
+            lines += ['# HELP api_db_queries_total Database queries executed',
+                      '# TYPE api_db_queries_total counter',
+                      f'api_db_queries_total {self.queries_total}',
+                      '# HELP api_db_query_seconds_total Time spent in database queries',
+                      '# TYPE api_db_query_seconds_total counter',
+                      f'api_db_query_seconds_total {self.query_seconds_total}']
+
+            lines += ['# HELP api_cache_lookups_total Response cache lookups by cache and result',
+                      '# TYPE api_cache_lookups_total counter']
+            caches = sorted(set(cache for cache, _ in self.cache_lookups))
+            for cache in caches:
+                for result in ('hit', 'miss'):
+                    lines.append(f'api_cache_lookups_total{format_labels({"cache": cache, "result": result})} '
+                                 f'{self.cache_lookups[(cache, result)]}')
+            lines += ['# HELP api_cache_hit_ratio Share of response cache lookups that were hits',
+                      '# TYPE api_cache_hit_ratio gauge']
+            for cache in caches:
+                hits, misses = self.cache_lookups[(cache, 'hit')], self.cache_lookups[(cache, 'miss')]
+                lines.append(f'api_cache_hit_ratio{format_labels({"cache": cache})} {hits / (hits + misses)}')
+
+        # Pool sizes are read when scraped; pools without a queue (e.g. SQLite) report what they have
+        lines += ['# HELP api_db_pool_connections Connections of the SQLAlchemy pool by state',
+                  '# TYPE api_db_pool_connections gauge']
+        for name, pool in sorted(self.pools.items()):
+            for state in ('size', 'checkedin', 'checkedout', 'overflow'):
+                value = getattr(pool, state, None)
+                if callable(value):
+                    lines.append(f'api_db_pool_connections{format_labels({"pool": name, "state": state})} {value()}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+### SQLAlchemy Events
+# Registered on the Engine class, so every engine created by Flask-SQLAlchemy is covered
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['query_start_time'].pop()
+    metrics.observe_query(seconds)
+    if has_request_context() and 'db_queries' in g:
+        g.db_queries += 1
+        g.db_seconds += seconds
+
+@event.listens_for(Engine, 'handle_error')
+def handle_error(context):
+    # A failed query never reaches after_cursor_execute
+    if context.connection is not None and context.connection.info.get('query_start_time'):
+        context.connection.info['query_start_time'].pop()
+
+### Flask Hooks
+def init_metrics(app):
+    @app.before_request
+    def start_request_timer():
+        g.request_start_time = time.perf_counter()
+        g.db_queries = 0
+        g.db_seconds = 0.0
+
+    @app.after_request
+    def record_request(response):
+        # Recorded when the response is closed, so streamed responses are timed
+        # (and their queries counted) until the last byte has been sent
+        if 'request_start_time' not in g:
+            return response
+        request_g = g._get_current_object()
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        method = request.method
+
+        def record():
+            metrics.observe_request(endpoint, method, response.status_code,
+                                    time.perf_counter() - request_g.request_start_time,
+                                    request_g.db_queries,
+                                    request_g.db_seconds)
+        response.call_on_close(record)
+        return response
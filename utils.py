@@ -0,0 +1,33 @@
+### Libraries
+# Helpers shared by the pipeline scripts; only the standard library, so that
+# importing them keeps the CLI's import budgets
+import os
+import sys
+import json
+import contextlib
+
+### Files
+@contextlib.contextmanager
+def atomic_write(path, mode="w", **open_kwargs):
+    # Written next to the target and renamed over it, so readers (and a resumed
+    # run after a crash) see either the previous file or the complete new one
+    tmp_path = path + ".tmp"
+    with open(tmp_path, mode, **open_kwargs) as f:
+        yield f
+    os.replace(tmp_path, path)
+
+def load_json(path, default):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return default
+
+def save_json(data, path, indent=None):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with atomic_write(path) as f:
+        json.dump(data, f, indent=indent)
+
+### Processes
+def max_rss_mb(rusage):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return rusage.ru_maxrss / (1024 ** 2 if sys.platform == "darwin" else 1024)